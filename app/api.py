@@ -1,17 +1,81 @@
-from fastapi import FastAPI, Depends, HTTPException, Form
+from fastapi import FastAPI, Depends, HTTPException, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import asyncio
+import functools
+import json
 import os
 import sys
+import threading
+import time
 
 # Add parent directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.utils.agent import TitanicAgent
-from app.utils.data_loader import get_dataset_info
+from app.utils.agent_pool import agent_pool, hash_api_key
+from app.utils.scheduler import query_scheduler, SchedulerRejected, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from app.utils.query_engine import get_plan_cache_stats, compile_filter, QueryError
+from app.utils.singleflight import SingleFlight
+from app.utils.chart_service import chart_service, VISUALIZATION_TYPES
+from app.utils.intent_router import intent_router
+from app.utils.data_loader import (
+    get_dataset_info, get_cache_stats, get_dataset_version, get_passengers, append_records, IngestError,
+)
+from app.utils.results import result_store, columnar_json, arrow_ipc
+from app.utils.answer_cache import answer_cache, get_warmup_questions, normalize_query
+from app.utils.metrics import (
+    METRICS_ENABLED, REQUEST_SECONDS, record_stage, timed,
+    start_request_timings, current_request_timings, finish_request_timings,
+    server_timing_header, render_metrics,
+)
+
+def _timed_endpoint(endpoint):
+    """Wrap an endpoint so its own run time is recorded as the "endpoint" stage"""
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with timed("endpoint"):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with timed("endpoint"):
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+class TimedRoute(APIRoute):
+    """
+    Route that splits handler time into the endpoint, the agent dependency
+    and everything FastAPI does around them (mostly request validation and
+    response serialization)
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            recorded = len(current_request_timings())
+            started = time.perf_counter()
+            response = await handler(request)
+            elapsed = time.perf_counter() - started
+            timings = current_request_timings()[recorded:]
+            handled = sum(seconds for stage, seconds in timings if stage in ("endpoint", "get_agent"))
+            record_stage("serialize", max(elapsed - handled, 0.0))
+            return response
+
+        return timed_handler
 
 app = FastAPI(title="Titanic Dataset ChatBot API")
+if METRICS_ENABLED:
+    app.router.route_class = TimedRoute
 
 # Enable CORS for local development
 app.add_middleware(
@@ -22,53 +86,466 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create a dependency for our agent
+if METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_timings(request: Request, call_next):
+        """Observe request latency and report per-stage timings in a Server-Timing header"""
+        token = start_request_timings()
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            timings = finish_request_timings(token)
+        elapsed = time.perf_counter() - started
+        route = request.scope.get("route")
+        path = getattr(route, "path", request.url.path)
+        REQUEST_SECONDS.observe(elapsed, method=request.method, path=path, status=response.status_code)
+        response.headers["Server-Timing"] = ", ".join(
+            filter(None, [server_timing_header(timings), f"total;dur={elapsed * 1000:.2f}"])
+        )
+        return response
+
+# Create a dependency for our agent (reused from the pool across requests)
 def get_agent():
     api_key = os.environ.get("OPENAI_API_KEY")
-    return TitanicAgent(api_key=api_key)
+    with timed("get_agent"):
+        return agent_pool.get(api_key)
+
+def _answer_mode(agent):
+    """Cache namespace: LLM answers of each agent mode and keyword fallback answers are kept apart"""
+    if not agent.agent:
+        return "simple"
+    return "llm" if agent.mode == "react" else f"llm-{agent.mode}"
+
+# Identical in-flight queries share one computation; LLM-bound ones are admitted by query_scheduler
+query_flights = SingleFlight()
+
+async def _ensure_router():
+    """Train the intent router off the event loop if a query arrives before the startup warm-up finishes"""
+    if not intent_router.trained:
+        await run_in_threadpool(intent_router.warm_up)
+
+def _needs_llm(agent, query):
+    """Whether answering this query will call the LLM (confidently routed queries don't)"""
+    return bool(agent.agent) and not intent_router.route(query).deterministic
+
+def _request_deadline(deadline_ms):
+    """time.monotonic() deadline for a request's time budget; None for the scheduler default"""
+    return time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+
+def _fallback_answer(agent, query):
+    """Fast keyword answer for a query shed by the scheduler; never cached"""
+    response = agent._simple_query_processor(query)
+    if not response["success"]:
+        response = {**response, "answer": "The assistant is busy right now. Please try again in a moment."}
+    return {**response, "degraded": True}
+
+def _limit_key(api_key):
+    """Scheduler key: per-key limits apply to callers' own API keys, not the server's"""
+    return hash_api_key(api_key) if api_key else None
+
+async def _compute_answer(agent, query, version, mode, priority, deadline, limit_key):
+    await _ensure_router()
+    if _needs_llm(agent, query):
+        try:
+            async with query_scheduler.slot(limit_key, priority, deadline):
+                response = await agent.aprocess_query(query)
+        except SchedulerRejected:
+            return await run_in_threadpool(_fallback_answer, agent, query)
+    else:
+        # Deterministic answers may rebuild the aggregates after a dataset change
+        response = await run_in_threadpool(agent.process_query, query)
+    answer_cache.put(query, version, response, mode)
+    return response
+
+async def answer_query(agent, query, priority=PRIORITY_INTERACTIVE, deadline=None, api_key=None):
+    """Answer a query, serving repeated questions from the answer cache"""
+    # Reloads the dataset when the file has changed
+    version = await run_in_threadpool(get_dataset_version)
+    mode = _answer_mode(agent)
+    response = answer_cache.get(query, version, mode)
+    if response is not None:
+        return {**response, "llm_calls": 0}
+    key = answer_cache.key(query, version, mode)
+    limit_key = _limit_key(api_key)
+    response = await query_flights.do(
+        key, lambda: _compute_answer(agent, query, version, mode, priority, deadline, limit_key)
+    )
+    return dict(response)
+
+@app.on_event("startup")
+def warm_up_intent_router():
+    """Train the intent router in the background so the first query doesn't pay for it"""
+    threading.Thread(target=intent_router.warm_up, daemon=True).start()
+
+@app.on_event("startup")
+def warm_up_answer_cache():
+    """Pre-answer the configured questions in the background"""
+    questions = get_warmup_questions()
+    if not questions:
+        return
+    agent = get_agent()
+    threading.Thread(
+        target=answer_cache.warm_up,
+        args=(questions, get_dataset_version(), agent.process_query),
+        kwargs={"mode": _answer_mode(agent)},
+        daemon=True,
+    ).start()
 
 class QueryRequest(BaseModel):
     query: str
     api_key: Optional[str] = None
+    # Time budget; LLM-bound queries that can't start within it get a fallback answer
+    deadline_ms: Optional[int] = None
+
+class ResultInfo(BaseModel):
+    id: str
+    query: str
+    rows: int
+    columns: List[str]
 
 class QueryResponse(BaseModel):
     answer: str
     visualization_type: Optional[str] = None
     success: bool
+    # Full tool results, fetched page by page from /results/{id}
+    results: List[ResultInfo] = []
+    # LLM calls this request made; 0 for answers served from the cache
+    llm_calls: int = 0
+    # True when the LLM was too busy and the keyword fallback answered instead
+    degraded: bool = False
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    api_key: Optional[str] = None
+    stream: bool = False
 
 @app.get("/")
 def read_root():
     return {"message": "Titanic Dataset ChatBot API is running"}
 
+@app.get("/health")
+def health():
+    """Liveness check for the supervisor; doesn't touch the dataset or the LLM"""
+    return {"status": "ok"}
+
 @app.get("/dataset-info")
 def dataset_information():
     """Get basic information about the Titanic dataset"""
     return get_dataset_info()
 
+PASSENGERS_MAX_LIMIT = 500
+
+@app.get("/passengers")
+def list_passengers(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=PASSENGERS_MAX_LIMIT),
+    filter: Optional[str] = None,
+):
+    """
+    Page through the raw passenger records. `filter` takes the same boolean
+    expressions as query(), e.g. "Sex == 'female' and Age < 10"
+    """
+    mask = None
+    if filter and filter.strip():
+        try:
+            mask = compile_filter(filter)
+        except QueryError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        page, total = get_passengers(offset, limit, mask)
+    except (TypeError, ValueError) as e:
+        # e.g. comparing a text column with a number
+        raise HTTPException(status_code=400, detail=f"Could not apply filter: {str(e)}")
+    return Response(
+        content=json.dumps({
+            "offset": offset,
+            "limit": limit,
+            "total": total,
+            "rows": json.loads(page.to_json(orient="records")),
+        }),
+        media_type="application/json",
+    )
+
+RESULTS_MAX_LIMIT = 10000
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+@app.get("/results/{result_id}")
+def result_page(
+    result_id: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=RESULTS_MAX_LIMIT),
+    format: Optional[str] = Query(None, pattern="^(json|arrow)$"),
+):
+    """
+    Page through a full query result as columnar JSON, or as an Arrow IPC
+    stream with format=arrow or Accept: application/vnd.apache.arrow.stream
+    """
+    entry = result_store.get(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired result: {result_id}")
+    frame, info = entry
+    page = frame.iloc[offset:offset + limit]
+    headers = {"X-Total-Count": str(info["rows"])}
+    
+    if format is None:
+        format = "arrow" if ARROW_STREAM_MEDIA_TYPE in request.headers.get("accept", "") else "json"
+    if format == "arrow":
+        try:
+            content = arrow_ipc(page)
+        except RuntimeError as e:
+            raise HTTPException(status_code=406, detail=str(e))
+        return Response(content=content, media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+    return Response(
+        content=columnar_json(page, offset, limit, info["rows"]),
+        media_type="application/json",
+        headers=headers,
+    )
+
+def _accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip: listed (or covered by *) with a q-value above 0"""
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+@app.get("/visualization/{visualization_type}")
+def visualization_spec(visualization_type: str, request: Request):
+    """
+    Get the Plotly JSON spec for a chart. Specs are built once per dataset
+    version; clients revalidate with If-None-Match and get a 304 when unchanged
+    """
+    if visualization_type not in VISUALIZATION_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown visualization type: {visualization_type}")
+    
+    spec = chart_service.get(visualization_type)
+    headers = {"ETag": spec.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if spec.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=spec.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=spec.body, media_type="application/json", headers=headers)
+
+@app.post("/ingest")
+async def ingest_records(request: Request):
+    """
+    Append passenger records, sent as JSON ({"records": [...]} or a list) or
+    as CSV with a header row (Content-Type: text/csv). Statistics and charts
+    are updated from the new rows alone
+    """
+    if request.headers.get("content-type", "").startswith("text/csv"):
+        records = (await request.body()).decode()
+    else:
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be JSON or CSV (Content-Type: text/csv)")
+        records = payload.get("records", []) if isinstance(payload, dict) else payload
+        if not isinstance(records, list):
+            # A JSON string would otherwise be parsed as CSV
+            raise HTTPException(status_code=400, detail="Records must be a list of objects")
+    
+    try:
+        # Appending fsyncs the file, so keep it off the event loop
+        return await run_in_threadpool(append_records, records)
+    except IngestError as e:
+        if e.column is None:
+            raise HTTPException(status_code=400, detail=str(e))
+        # A well-formed batch with a bad value: point at it
+        raise HTTPException(status_code=422, detail={"message": str(e), "row": e.row, "column": e.column})
+
+@app.get("/stats")
+def cache_statistics():
+    """Get hit/miss counters for the server-side caches"""
+    return {
+        "dataset_cache": get_cache_stats(),
+        "agent_pool": agent_pool.stats(),
+        "query_plans": get_plan_cache_stats(),
+        "answer_cache": answer_cache.stats(),
+        "query_flights": query_flights.stats(),
+        "charts": chart_service.stats(),
+        "intent_router": intent_router.stats(),
+        "results": result_store.stats(),
+        "scheduler": query_scheduler.stats(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Request, stage and LLM call metrics in the Prometheus text format"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/query", response_model=QueryResponse)
-def process_query(query_request: QueryRequest, agent: TitanicAgent = Depends(get_agent)):
+async def process_query(query_request: QueryRequest, agent: TitanicAgent = Depends(get_agent)):
     """Process a natural language query about the Titanic dataset"""
     if query_request.api_key:
-        # If API key provided in request, create a new agent with it
-        agent = TitanicAgent(api_key=query_request.api_key)
+        # If API key provided in request, use the pooled agent for that key
+        agent = await run_in_threadpool(agent_pool.get, query_request.api_key)
     
-    response = agent.process_query(query_request.query)
+    response = await answer_query(
+        agent, query_request.query, deadline=_request_deadline(query_request.deadline_ms), api_key=query_request.api_key
+    )
     return response
 
 @app.post("/query-form")
-def process_query_form(
+async def process_query_form(
     query: str = Form(...),
     api_key: Optional[str] = Form(None),
     agent: TitanicAgent = Depends(get_agent)
 ):
     """Form-based endpoint for processing queries (useful for Streamlit)"""
     if api_key:
-        # If API key provided in form, create a new agent with it
-        agent = TitanicAgent(api_key=api_key)
+        # If API key provided in form, use the pooled agent for that key
+        agent = await run_in_threadpool(agent_pool.get, api_key)
     
-    response = agent.process_query(query)
+    response = await answer_query(agent, query, api_key=api_key)
     return response
 
+def _sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_answer(agent, query, deadline=None, api_key=None):
+    version = await run_in_threadpool(get_dataset_version)
+    mode = _answer_mode(agent)
+    cached = answer_cache.get(query, version, mode)
+    if cached is not None:
+        yield _sse_event("visualization", {"visualization_type": cached["visualization_type"]})
+        yield _sse_event("answer", {**cached, "llm_calls": 0})
+        return
+    
+    async def events():
+        async for event, data in agent.astream_query(query):
+            if event == "answer":
+                answer_cache.put(query, version, data, mode)
+            yield _sse_event(event, data)
+    
+    await _ensure_router()
+    if not _needs_llm(agent, query):
+        async for event in events():
+            yield event
+        return
+    try:
+        async with query_scheduler.slot(_limit_key(api_key), PRIORITY_INTERACTIVE, deadline):
+            async for event in events():
+                yield event
+    except SchedulerRejected:
+        # Only raised before the slot is granted, so nothing has been sent yet
+        response = await run_in_threadpool(_fallback_answer, agent, query)
+        yield _sse_event("visualization", {"visualization_type": response["visualization_type"]})
+        yield _sse_event("answer", response)
+
+@app.post("/query/stream")
+async def stream_query(query_request: QueryRequest, agent: TitanicAgent = Depends(get_agent)):
+    """
+    Process a query and stream progress as Server-Sent Events: `visualization`,
+    then `step`/`observation` for each agent action, `token` for final answer
+    text, and a closing `answer` event with the full response
+    """
+    if query_request.api_key:
+        agent = await run_in_threadpool(agent_pool.get, query_request.api_key)
+    
+    return StreamingResponse(
+        _stream_answer(agent, query_request.query, _request_deadline(query_request.deadline_ms), query_request.api_key),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "100"))
+BATCH_MAX_PARALLEL = int(os.environ.get("BATCH_MAX_PARALLEL", "4"))
+
+async def _run_batch(agent, questions, api_key=None):
+    """
+    Answer a batch of questions, yielding (indices, result) as each distinct
+    question completes. Duplicates (by normalized text) are answered once.
+    Confidently routed questions are answered together from the aggregate
+    cube; the rest go to the agent with at most BATCH_MAX_PARALLEL in flight.
+    """
+    groups = {}
+    for index, question in enumerate(questions):
+        groups.setdefault(normalize_query(question), []).append(index)
+    unique = [questions[indices[0]] for indices in groups.values()]
+    index_groups = list(groups.values())
+    
+    # One vectorized routing pass, then cube answers for every deterministic question
+    await _ensure_router()
+    started = time.perf_counter()
+    decisions = intent_router.route_many(unique)
+    deterministic = [position for position, decision in enumerate(decisions) if decision.deterministic]
+    answers = await run_in_threadpool(agent.answer_intents, [decisions[position].intent for position in deterministic])
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for position, answer in zip(deterministic, answers):
+        intent_router.record(decisions[position])
+        yield index_groups[position], {**answer, "elapsed_ms": elapsed_ms, "error": None}
+    
+    semaphore = asyncio.Semaphore(BATCH_MAX_PARALLEL)
+    
+    async def answer_one(position):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await answer_query(agent, unique[position], priority=PRIORITY_BATCH, api_key=api_key)
+                result = {**result, "error": None if result["success"] else result["answer"]}
+            except Exception as e:
+                result = {"answer": "", "visualization_type": None, "success": False, "error": str(e)}
+            result["elapsed_ms"] = (time.perf_counter() - started) * 1000
+            return position, result
+    
+    pending = [answer_one(position) for position, decision in enumerate(decisions) if not decision.deterministic]
+    for next_done in asyncio.as_completed(pending):
+        position, result = await next_done
+        yield index_groups[position], result
+
+@app.post("/query/batch")
+async def process_query_batch(batch_request: BatchQueryRequest, agent: TitanicAgent = Depends(get_agent)):
+    """
+    Answer a list of questions. Results come back in input order with
+    per-item timings and errors, or as NDJSON lines in completion order
+    when `stream` is true
+    """
+    if len(batch_request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {BATCH_MAX_QUESTIONS} questions")
+    if batch_request.api_key:
+        agent = await run_in_threadpool(agent_pool.get, batch_request.api_key)
+    questions = batch_request.questions
+    
+    if batch_request.stream:
+        async def ndjson_lines():
+            async for indices, result in _run_batch(agent, questions, batch_request.api_key):
+                for index in indices:
+                    yield json.dumps({"index": index, "query": questions[index], **result}) + "\n"
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+    
+    started = time.perf_counter()
+    results = [None] * len(questions)
+    async for indices, result in _run_batch(agent, questions, batch_request.api_key):
+        for index in indices:
+            results[index] = {"index": index, "query": questions[index], **result}
+    return {
+        "results": results,
+        "unique_questions": len({normalize_query(question) for question in questions}),
+        "elapsed_ms": (time.perf_counter() - started) * 1000,
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
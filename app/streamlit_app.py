@@ -1,25 +1,13 @@
 import streamlit as st
-import requests
-import pandas as pd
-import plotly.graph_objects as go
 import os
-import json
 import sys
+import time
 
 # Add parent directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.utils.data_loader import load_titanic_dataset
-from app.utils.visualizations import (
-    plot_age_histogram, 
-    plot_fare_histogram, 
-    plot_gender_distribution,
-    plot_embarkation_count,
-    plot_survival_by_class,
-    plot_survival_count,
-    plot_age_vs_fare,
-    plot_correlation_heatmap
-)
+from app.utils.api_client import TitanicAPIClient, API_ENDPOINT
+
 # Set page config
 st.set_page_config(
     page_title="Titanic Dataset Chatbot",
@@ -28,8 +16,29 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Define API endpoint (local FastAPI server)
-API_ENDPOINT = "http://localhost:8000"
+# How long responses are reused before asking the API again (seconds)
+DATASET_INFO_TTL = 60
+ANSWER_TTL = 300
+CHART_FRESH_SECONDS = 30
+RAW_PAGE_SIZES = [25, 50, 100, 500]
+RESULT_PAGE_SIZE = 100
+
+@st.cache_resource
+def get_client():
+    """One pooled keep-alive HTTP client, shared by every session of this Streamlit server"""
+    return TitanicAPIClient(API_ENDPOINT)
+
+@st.cache_data(ttl=DATASET_INFO_TTL, show_spinner=False)
+def load_dataset_info():
+    return get_client().dataset_info()
+
+@st.cache_data(ttl=DATASET_INFO_TTL, show_spinner=False)
+def load_passengers(offset, limit, filter):
+    return get_client().passengers(offset, limit, filter)
+
+@st.cache_data(ttl=ANSWER_TTL, show_spinner=False)
+def load_result_page(result_id, offset, limit):
+    return get_client().result_page(result_id, offset, limit)
 
 # App title and description
 st.title("🚢 Titanic Dataset Chatbot")
@@ -46,9 +55,8 @@ with st.sidebar:
     
     st.header("About the Dataset")
     try:
-        info_response = requests.get(f"{API_ENDPOINT}/dataset-info")
-        if info_response.status_code == 200:
-            dataset_info = info_response.json()
+        dataset_info = load_dataset_info()
+        if dataset_info:
             st.write(f"Total passengers: {dataset_info['total_passengers']}")
             st.write(f"Survived: {dataset_info['survived_count']} ({dataset_info['survival_rate']})")
             
@@ -66,7 +74,7 @@ with st.sidebar:
                 st.write("No missing values")
     except Exception as e:
         st.error(f"Could not connect to API: {str(e)}")
-        st.info("Make sure the FastAPI server is running on http://localhost:8000")
+        st.info(f"Make sure the FastAPI server is running on {API_ENDPOINT}")
 
 # Example questions
 st.sidebar.header("Example Questions")
@@ -89,74 +97,139 @@ if "query" not in st.session_state:
 # User input
 query = st.text_input("Ask a question about the Titanic:", value=st.session_state.query)
 
-# Process the query
+def fetch_chart_spec(visualization_type):
+    """
+    Fetch a chart's Plotly JSON spec from the API. The copy kept in the session
+    is reused for a few seconds and then revalidated with its ETag, so an
+    unchanged chart costs at most a single 304
+    """
+    chart_cache = st.session_state.setdefault("chart_cache", {})
+    cached = chart_cache.get(visualization_type)
+    if cached and time.time() - cached["fetched"] < CHART_FRESH_SECONDS:
+        return cached["spec"]
+    
+    etag, spec = get_client().chart_spec(visualization_type, cached["etag"] if cached else None)
+    if spec is None:
+        spec = cached["spec"]
+    chart_cache[visualization_type] = {"etag": etag, "spec": spec, "fetched": time.time()}
+    return spec
+
+def render_visualization(visualization_type):
+    """Draw the chart for a visualization type"""
+    if not visualization_type:
+        return
+    spec = fetch_chart_spec(visualization_type)
+    if spec:
+        # Plotly is only needed once there is a chart to draw
+        import plotly.io as pio
+        st.markdown("### Visualization")
+        st.plotly_chart(pio.from_json(spec), use_container_width=True)
+
+def show_answer(placeholder, response):
+    if response["success"]:
+        placeholder.write(response["answer"])
+    else:
+        placeholder.warning(response["answer"])
+
+def show_results(response):
+    """Full tool results, which the agent only saw truncated, one page at a time from the API"""
+    for result in response.get("results") or []:
+        with st.expander(f"Full result of `{result['query']}` ({result['rows']} rows)"):
+            pages = max(1, -(-result["rows"] // RESULT_PAGE_SIZE))
+            page_number = st.number_input(
+                "Page", min_value=1, max_value=pages, value=1, step=1, key=f"result_page_{result['id']}"
+            )
+            offset = (page_number - 1) * RESULT_PAGE_SIZE
+            try:
+                page = load_result_page(result["id"], offset, RESULT_PAGE_SIZE)
+            except Exception as e:
+                # Results are kept for a limited time on the server
+                st.warning(f"This result is no longer available: {str(e)}")
+                continue
+            st.dataframe(page["data"], use_container_width=True)
+            last = offset + len(next(iter(page["data"].values()), []))
+            st.caption(f"Rows {offset + 1}-{last} of {page['total']}")
+
+def stream_answer(query, api_key, answer_placeholder, steps_container, visualization_container):
+    """
+    Stream the answer from our FastAPI backend so the chart and partial answer
+    show up before the agent finishes. Returns the final response and the agent steps
+    """
+    partial_answer, steps, response = "", [], None
+    for event, data in get_client().stream_query(query, api_key):
+        if event == "visualization":
+            with visualization_container:
+                render_visualization(data["visualization_type"])
+        elif event == "step":
+            steps.append(("step", f"**{data['tool']}**: `{data['tool_input']}`"))
+            steps_container.markdown(steps[-1][1])
+        elif event == "observation":
+            steps.append(("observation", data["observation"]))
+            steps_container.text(steps[-1][1])
+        elif event == "token":
+            partial_answer += data["text"]
+            answer_placeholder.markdown(partial_answer + " ▌")
+        elif event == "answer":
+            response = data
+            show_answer(answer_placeholder, data)
+    return response, steps
+
+# Process the query. Answers are kept per question for a while, so reruns
+# triggered by other widgets redraw them without calling the API again
 if query:
-    # Show a spinner while processing
-    with st.spinner("Processing your question..."):
-        try:
-            # Prepare the request data
-            payload = {
-                "query": query,
-                "api_key": user_api_key if user_api_key else None
-            }
-            
-            # Send request to our FastAPI backend
-            response = requests.post(f"{API_ENDPOINT}/query", json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Display the answer
-                st.markdown("### Answer")
-                st.write(result["answer"])
-                
-                # Display visualization if available
-                if result["visualization_type"]:
-                    st.markdown("### Visualization")
-                    
-                    # Based on the visualization type, call the appropriate function
-                    if result["visualization_type"] == "age_histogram":
-                        fig = plot_age_histogram()
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    elif result["visualization_type"] == "fare_histogram":
-                        fig = plot_fare_histogram()
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    elif result["visualization_type"] == "gender_distribution":
-                        fig = plot_gender_distribution()
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    elif result["visualization_type"] == "embarkation_count":
-                        fig = plot_embarkation_count()
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    elif result["visualization_type"] == "survival_by_class":
-                        fig = plot_survival_by_class()
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    elif result["visualization_type"] == "survival_count":
-                        fig = plot_survival_count()
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    elif result["visualization_type"] == "age_vs_fare":
-                        fig = plot_age_vs_fare()
-                        st.plotly_chart(fig, use_container_width=True)
-                    
-                    elif result["visualization_type"] == "correlation_heatmap":
-                        fig = plot_correlation_heatmap()
-                        st.plotly_chart(fig, use_container_width=True)
+    answers = st.session_state.setdefault("answers", {})
+    answer_key = (" ".join(query.lower().split()), bool(user_api_key))
+    cached = answers.get(answer_key)
+    if cached and time.time() - cached["answered"] > ANSWER_TTL:
+        cached = None
+    
+    st.markdown("### Answer")
+    answer_placeholder = st.empty()
+    steps_container = st.expander("Agent steps", expanded=False)
+    visualization_container = st.container()
+    
+    if cached:
+        show_answer(answer_placeholder, cached["response"])
+        for kind, text in cached["steps"]:
+            if kind == "step":
+                steps_container.markdown(text)
             else:
-                st.error(f"Error from API: {response.text}")
-        
+                steps_container.text(text)
+        with visualization_container:
+            render_visualization(cached["response"]["visualization_type"])
+        show_results(cached["response"])
+    else:
+        answer_placeholder.info("Processing your question...")
+        try:
+            response, steps = stream_answer(
+                query, user_api_key, answer_placeholder, steps_container, visualization_container
+            )
+            if response and response["success"]:
+                answers[answer_key] = {"response": response, "steps": steps, "answered": time.time()}
+                show_results(response)
         except Exception as e:
-            st.error(f"Error connecting to the backend: {str(e)}")
-            st.info("Make sure the FastAPI server is running on http://localhost:8000")
+            answer_placeholder.error(f"Error connecting to the backend: {str(e)}")
+            st.info(f"Make sure the FastAPI server is running on {API_ENDPOINT}")
 
-# Display the dataset (initially collapsed)
+# Display the dataset (initially collapsed), one page at a time from the API
 with st.expander("View Raw Dataset"):
-    df = load_titanic_dataset()
-    st.dataframe(df)
+    filter_col, size_col, page_col = st.columns([3, 1, 1])
+    raw_filter = filter_col.text_input(
+        "Filter", placeholder="e.g. Sex == 'female' and Age < 10", key="raw_filter"
+    ).strip()
+    page_size = size_col.selectbox("Rows per page", RAW_PAGE_SIZES, index=1, key="raw_page_size")
+    page_number = page_col.number_input("Page", min_value=1, value=1, step=1, key="raw_page")
+    try:
+        page = load_passengers((page_number - 1) * page_size, page_size, raw_filter or None)
+        st.dataframe(page["rows"], use_container_width=True)
+        first = page["offset"] + 1 if page["rows"] else 0
+        last = page["offset"] + len(page["rows"])
+        total = f" of {page['total']}" if page["total"] is not None else ""
+        st.caption(f"Rows {first}-{last}{total}")
+    except ValueError as e:
+        st.warning(f"Invalid filter: {str(e)}")
+    except Exception as e:
+        st.error(f"Could not load passengers: {str(e)}")
 
 # Footer
 st.markdown("---")
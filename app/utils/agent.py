@@ -1,43 +1,86 @@
+import asyncio
+import contextvars
 import os
 import pandas as pd
 import sys
-from langchain.agents import AgentType, initialize_agent, Tool
-from langchain.chains import LLMChain
-from langchain_community.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.tools import tool
-from langchain_openai import OpenAI
 
 # Add parent directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.utils.data_loader import load_titanic_dataset
+from app.utils.aggregates import get_aggregate_cube
+from app.utils.query_engine import run_query
+from app.utils.intent_router import intent_router, INTENT_VISUALIZATIONS
+from app.utils.metrics import METRICS_ENABLED, LLM_CALLS_PER_QUERY, timed
+from app.utils.results import shape_for_llm, record_result, collect_results
+from app.utils.planner import (
+    EXPRESSION_HELP, PLAN_PHRASE_ANSWER, plan_prompt, parse_plan, fill_answer, phrase_prompt,
+)
+
+# "react" lets the agent explore the data over several LLM round trips; "plan"
+# sends a schema digest and gets the whole query plan back in a single call
+AGENT_MODES = ("react", "plan")
+AGENT_MODE = os.environ.get("AGENT_MODE", "react")
+
+def metrics_callbacks():
+    """LangChain callbacks to pass to agent runs"""
+    if not METRICS_ENABLED:
+        return []
+    # LangChain is only imported once an agent actually runs
+    from app.utils.agent_callbacks import LLMMetricsCallbackHandler
+    return [LLMMetricsCallbackHandler()]
+
+def llm_callbacks():
+    """A fresh LLM call counter and the callbacks to pass to every LLM call of one query"""
+    from app.utils.agent_callbacks import LLMCallCounter
+    counter = LLMCallCounter()
+    return counter, [counter] + metrics_callbacks()
 
 class TitanicAgent:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, http_client=None, http_async_client=None, llm=None, mode=None):
         # Use provided API key or try to get from environment
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY", None)
+        self.mode = mode or AGENT_MODE
+        if self.mode not in AGENT_MODES:
+            raise ValueError(f"Unknown agent mode '{self.mode}', expected one of {', '.join(AGENT_MODES)}")
+        self.llm = None
         
         # If no API key is available, we'll use an alternative approach
         # by constructing simple responses based on predefined queries
-        if not self.api_key:
+        if not self.api_key and llm is None:
             print("Warning: No OpenAI API key found. Using simplified query processing.")
             self.agent = None
-            self.df = load_titanic_dataset()
         else:
-            # Initialize the LLM
-            llm = OpenAI(openai_api_key=self.api_key, temperature=0)
+            # Deferred so that keyword-only deployments never pay for importing LangChain
+            from langchain.agents import AgentType, initialize_agent, Tool
+            
+            # Initialize the LLM, reusing the caller's pooled HTTP clients if given.
+            # A ready-made llm (e.g. the benchmark's fake LLM) replaces OpenAI entirely.
+            if llm is None:
+                from langchain_openai import OpenAI
+                llm = OpenAI(
+                    openai_api_key=self.api_key,
+                    temperature=0,
+                    streaming=True,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                )
+            self.llm = llm
             
             # Define tools for the agent
             tools = [
                 Tool(
                     name="PassengerQuery",
                     func=self.query_passengers,
-                    description="Useful for answering questions about Titanic passengers, their demographics, survival rates, and other statistics."
+                    description=(
+                        "Useful for answering questions about Titanic passengers, their demographics, survival rates, and other statistics. "
+                        f"{EXPRESSION_HELP} "
+                        "Columns: PassengerId, Survived, Pclass, Name, Sex, Age, SibSp, Parch, Ticket, Fare, Cabin, Embarked."
+                    )
                 )
             ]
             
-            # Initialize the agent
+            # Initialize the agent; plan mode falls back to it when a plan doesn't work out
             self.agent = initialize_agent(
                 tools=tools,
                 llm=llm,
@@ -45,127 +88,310 @@ class TitanicAgent:
                 verbose=True
             )
     
-    def query_passengers(self, query):
-        """Execute a query on the Titanic dataset"""
+    @property
+    def df(self):
+        """The current dataset, served from the process-wide cache"""
+        return load_titanic_dataset()
+    
+    def _run_tool(self, query):
+        """Run a query and return (result, result text for the LLM)"""
         df = load_titanic_dataset()
         
-        # Try to interpret the query as a pandas operation
+        # Interpret the query with the restricted query engine (no eval)
+        with timed("tool"):
+            result = run_query(query, df)
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            # The client gets the full table; the LLM only needs enough to answer
+            record_result(query, result)
+        return result, shape_for_llm(result)
+    
+    def query_passengers(self, query):
+        """Execute a query on the Titanic dataset"""
         try:
-            # This is a simplified approach and would need robust security measures in production
-            # For demonstration purposes only
-            result = eval(f"df.{query}")
-            if isinstance(result, pd.DataFrame):
-                return result.to_string()
-            else:
-                return str(result)
+            return self._run_tool(query)[1]
         except Exception as e:
             return f"Error executing query: {str(e)}"
     
+    def _run_plan(self, plan):
+        """Run a plan's expression locally; (None, None) for plans answered without data"""
+        if plan.expression is None:
+            return None, None
+        return self._run_tool(plan.expression)
+    
+    def _invoke(self, prompt, callbacks):
+        reply = self.llm.invoke(prompt, config={"callbacks": callbacks})
+        return getattr(reply, "content", reply)
+    
+    async def _ainvoke(self, prompt, callbacks):
+        reply = await self.llm.ainvoke(prompt, config={"callbacks": callbacks})
+        return getattr(reply, "content", reply)
+    
+    def _plan_and_answer(self, query, callbacks):
+        """
+        Plan mode: one LLM call returns the query plan, which runs locally, and at
+        most one more call phrases the answer. Returns (answer, visualization type)
+        """
+        try:
+            plan = parse_plan(self._invoke(plan_prompt(query), callbacks))
+            result, observation = self._run_plan(plan)
+        except Exception as e:
+            # The ReAct loop can recover from a bad column name or expression
+            print(f"Query plan failed ({str(e)}), falling back to the ReAct agent")
+            return self.agent.run(query, callbacks=callbacks), None
+        
+        answer = fill_answer(plan, result)
+        if answer is None:
+            if PLAN_PHRASE_ANSWER:
+                answer = self._invoke(phrase_prompt(query, plan.expression, observation), callbacks)
+            else:
+                answer = observation
+        return answer.strip(), plan.visualization_type
+    
+    async def _aplan_and_answer(self, query, callbacks, visualization_type, queue=None):
+        """
+        Async version of _plan_and_answer. With a queue, the visualization type,
+        the plan's step and observation and the answer tokens are streamed to it
+        """
+        async def emit(event, data):
+            if queue is not None:
+                await queue.put((event, data))
+        
+        loop = asyncio.get_running_loop()
+        try:
+            # The schema digest is rebuilt from the dataset after it changes
+            prompt = await loop.run_in_executor(None, contextvars.copy_context().run, plan_prompt, query)
+            plan = parse_plan(await self._ainvoke(prompt, callbacks))
+            # In a thread that inherits the context, so the result is collected for this query
+            context = contextvars.copy_context()
+            result, observation = await loop.run_in_executor(None, context.run, self._run_plan, plan)
+        except Exception as e:
+            print(f"Query plan failed ({str(e)}), falling back to the ReAct agent")
+            await emit("visualization", {"visualization_type": visualization_type})
+            if queue is not None:
+                from app.utils.agent_callbacks import StreamingAgentCallbackHandler
+                callbacks = callbacks + [StreamingAgentCallbackHandler(queue)]
+            return await self.agent.arun(query, callbacks=callbacks), visualization_type
+        
+        visualization_type = plan.visualization_type or visualization_type
+        await emit("visualization", {"visualization_type": visualization_type})
+        if plan.expression is not None:
+            await emit("step", {"tool": "PassengerQuery", "tool_input": plan.expression})
+            await emit("observation", {"observation": observation})
+        
+        answer = fill_answer(plan, result)
+        if answer is None and not PLAN_PHRASE_ANSWER:
+            answer = observation
+        elif answer is None:
+            prompt = phrase_prompt(query, plan.expression, observation)
+            if queue is None:
+                answer = await self._ainvoke(prompt, callbacks)
+            else:
+                answer = ""
+                async for chunk in self.llm.astream(prompt, config={"callbacks": callbacks}):
+                    text = getattr(chunk, "content", chunk)
+                    answer += text
+                    await emit("token", {"text": text})
+        return answer.strip(), visualization_type
+    
+    async def _answer_locally(self, decision, query):
+        """
+        The deterministic or keyword answer, computed in a thread: a dataset
+        change makes it rebuild the aggregates, which mustn't stall the event loop
+        """
+        if decision.deterministic:
+            func, arg = self._answer_intent, decision.intent
+        else:
+            func, arg = self._simple_query_processor, query
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, context.run, func, arg)
+    
+    def _llm_response(self, answer, visualization_type, results, counter):
+        if METRICS_ENABLED:
+            LLM_CALLS_PER_QUERY.observe(counter.calls, mode=self.mode)
+        return {
+            "answer": answer,
+            "visualization_type": visualization_type,
+            "success": True,
+            "results": results,
+            "llm_calls": counter.calls
+        }
+    
     def process_query(self, query):
         """Process a natural language query about the Titanic dataset"""
+        # Questions the intent router is confident about never reach the LLM
+        with timed("route"):
+            decision = intent_router.route(query)
+        intent_router.record(decision)
+        if decision.deterministic:
+            return self._answer_intent(decision.intent)
+        
         # If we have an agent, use it
         if self.agent:
+            counter, callbacks = llm_callbacks()
             try:
-                response = self.agent.run(query)
-                return {
-                    "answer": response,
-                    "visualization_type": self._determine_visualization(query),
-                    "success": True
-                }
+                with timed("agent_run"), collect_results() as results:
+                    if self.mode == "plan":
+                        answer, visualization_type = self._plan_and_answer(query, callbacks)
+                    else:
+                        answer, visualization_type = self.agent.run(query, callbacks=callbacks), None
+                return self._llm_response(answer, visualization_type or decision.visualization_type, results, counter)
             except Exception as e:
                 return {
                     "answer": f"Error processing query: {str(e)}",
                     "visualization_type": None,
-                    "success": False
+                    "success": False,
+                    "llm_calls": counter.calls
                 }
         
         # If no agent, use simple keyword matching
         else:
             return self._simple_query_processor(query)
     
+    async def aprocess_query(self, query):
+        """Async version of process_query that does not block a worker thread during LLM calls"""
+        with timed("route"):
+            decision = intent_router.route(query)
+        intent_router.record(decision)
+        if decision.deterministic or not self.agent:
+            return await self._answer_locally(decision, query)
+        counter, callbacks = llm_callbacks()
+        try:
+            with timed("agent_run"), collect_results() as results:
+                if self.mode == "plan":
+                    answer, visualization_type = await self._aplan_and_answer(
+                        query, callbacks, decision.visualization_type
+                    )
+                else:
+                    answer = await self.agent.arun(query, callbacks=callbacks)
+                    visualization_type = decision.visualization_type
+            return self._llm_response(answer, visualization_type, results, counter)
+        except Exception as e:
+            return {
+                "answer": f"Error processing query: {str(e)}",
+                "visualization_type": None,
+                "success": False,
+                "llm_calls": counter.calls
+            }
+    
+    async def astream_query(self, query):
+        """
+        Process a query incrementally, yielding (event, data) pairs: the visualization
+        type first, then each agent step and observation, final answer tokens as they
+        are generated, and finally the complete response.
+        """
+        with timed("route"):
+            decision = intent_router.route(query)
+        intent_router.record(decision)
+        if decision.deterministic or not self.agent:
+            response = await self._answer_locally(decision, query)
+            yield "visualization", {"visualization_type": response["visualization_type"]}
+            yield "answer", response
+            return
+        
+        visualization_type = decision.visualization_type
+        queue = asyncio.Queue()
+        if self.mode != "plan":
+            # Plan mode sends the visualization type once the plan has chosen it
+            yield "visualization", {"visualization_type": visualization_type}
+        
+        async def run_agent():
+            counter, callbacks = llm_callbacks()
+            try:
+                with timed("agent_run"), collect_results() as results:
+                    if self.mode == "plan":
+                        answer, chosen_type = await self._aplan_and_answer(query, callbacks, visualization_type, queue)
+                    else:
+                        from app.utils.agent_callbacks import StreamingAgentCallbackHandler
+                        answer = await self.agent.arun(query, callbacks=[StreamingAgentCallbackHandler(queue)] + callbacks)
+                        chosen_type = visualization_type
+                response = self._llm_response(answer, chosen_type, results, counter)
+            except Exception as e:
+                response = {"answer": f"Error processing query: {str(e)}", "visualization_type": None, "success": False, "llm_calls": counter.calls}
+            await queue.put(("answer", response))
+        
+        task = asyncio.ensure_future(run_agent())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event == "answer":
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
+    
     def _simple_query_processor(self, query):
         """Simple keyword-based query processor as a fallback"""
-        query = query.lower()
+        # Without an LLM, the router's best guess is used as long as it has keyword support
+        decision = intent_router.route(query)
+        if decision.covered and (decision.deterministic or decision.features):
+            return self._answer_intent(decision.intent)
         
-        # Different query patterns
-        if "percentage" in query and "male" in query:
-            male_percentage = (self.df['Sex'] == 'male').mean() * 100
-            return {
-                "answer": f"{male_percentage:.2f}% of passengers were male on the Titanic.",
-                "visualization_type": "gender_distribution",
-                "success": True
-            }
+        return {
+            "answer": "I'm not sure how to answer that question about the Titanic dataset. Try asking about passenger demographics, survival rates, ticket fares, or embarkation ports.",
+            "visualization_type": None,
+            "success": False
+        }
+    
+    def answer_intents(self, intents):
+        """Answer several routed intents, sharing one cube lookup and one answer per distinct intent"""
+        answers = {intent: self._answer_intent(intent) for intent in set(intents)}
+        return [dict(answers[intent]) for intent in intents]
+    
+    def _answer_intent(self, intent):
+        """Answer a routed intent deterministically from the aggregate cube"""
+        cube = get_aggregate_cube()
+        totals = cube.total()
         
-        elif "histogram" in query and "age" in query:
-            return {
-                "answer": "Here's a histogram showing the distribution of passenger ages.",
-                "visualization_type": "age_histogram",
-                "success": True
-            }
+        if intent == "gender_distribution":
+            male_percentage = cube.cell(Sex='male')['count'] / totals['count'] * 100
+            female_percentage = cube.cell(Sex='female')['count'] / totals['count'] * 100
+            answer = f"{male_percentage:.2f}% of passengers were male and {female_percentage:.2f}% were female on the Titanic."
         
-        elif "average" in query and "fare" in query:
-            avg_fare = self.df['Fare'].mean()
-            return {
-                "answer": f"The average ticket fare was ${avg_fare:.2f}.",
-                "visualization_type": "fare_histogram",
-                "success": True
-            }
+        elif intent == "age_distribution":
+            answer = (
+                "Here's a histogram showing the distribution of passenger ages. "
+                f"The average age was {totals['Age_mean']:.2f} years ({totals['Age_count']} passengers have a known age)."
+            )
         
-        elif "embark" in query or "port" in query:
-            port_counts = self.df['Embarked'].value_counts()
+        elif intent == "average_fare":
+            answer = f"The average ticket fare was ${totals['Fare_mean']:.2f}."
+        
+        elif intent == "embarkation":
+            port_counts = {port: stats['count'] for port, stats in cube.rollup('Embarked').items() if port is not None}
             port_mapping = {'C': 'Cherbourg', 'Q': 'Queenstown', 'S': 'Southampton'}
-            port_info = ", ".join([f"{port_mapping.get(port, port)}: {count}" for port, count in port_counts.items()])
-            
-            return {
-                "answer": f"Passengers embarked from the following ports: {port_info}",
-                "visualization_type": "embarkation_count",
-                "success": True
-            }
+            port_info = ", ".join([f"{port_mapping.get(port, port)}: {count}" for port, count in sorted(port_counts.items(), key=lambda item: -item[1])])
+            answer = f"Passengers embarked from the following ports: {port_info}"
         
-        elif "survival" in query and ("class" in query or "pclass" in query):
-            return {
-                "answer": "Here's the survival rate breakdown by passenger class.",
-                "visualization_type": "survival_by_class",
-                "success": True
-            }
+        elif intent == "survival_by_class":
+            class_names = {1: '1st', 2: '2nd', 3: '3rd'}
+            rates = ", ".join([
+                f"{class_names.get(pclass, pclass)} class: {stats['Survived_mean'] * 100:.2f}%"
+                for pclass, stats in sorted(cube.rollup('Pclass').items())
+            ])
+            answer = f"Here's the survival rate breakdown by passenger class: {rates}."
         
-        elif "survival" in query or "survived" in query:
-            survival_count = self.df['Survived'].sum()
-            total = len(self.df)
+        elif intent == "survival_by_gender":
+            female_rate = cube.cell(Sex='female')['Survived_mean'] * 100
+            male_rate = cube.cell(Sex='male')['Survived_mean'] * 100
+            comparison = "higher" if female_rate > male_rate else "lower"
+            answer = f"Women had a {comparison} survival rate than men: {female_rate:.2f}% of women survived compared with {male_rate:.2f}% of men."
+        
+        elif intent == "survival_overall":
+            survival_count = int(totals['Survived_sum'])
+            total = totals['count']
             survival_rate = (survival_count / total) * 100
-            
-            return {
-                "answer": f"{survival_count} passengers survived out of {total}, a survival rate of {survival_rate:.2f}%.",
-                "visualization_type": "survival_count",
-                "success": True
-            }
+            answer = f"{survival_count} passengers survived out of {total}, a survival rate of {survival_rate:.2f}%."
         
         else:
-            return {
-                "answer": "I'm not sure how to answer that question about the Titanic dataset. Try asking about passenger demographics, survival rates, ticket fares, or embarkation ports.",
-                "visualization_type": None,
-                "success": False
-            }
+            raise ValueError(f"No deterministic answer for intent '{intent}'")
+        
+        return {
+            "answer": answer,
+            "visualization_type": INTENT_VISUALIZATIONS[intent],
+            "success": True
+        }
     
     def _determine_visualization(self, query):
         """Determine which visualization to show based on the query"""
-        query = query.lower()
-        
-        if "age" in query and ("histogram" in query or "distribution" in query):
-            return "age_histogram"
-        elif "fare" in query and ("histogram" in query or "distribution" in query):
-            return "fare_histogram"
-        elif "gender" in query or "male" in query or "female" in query:
-            return "gender_distribution"
-        elif "embark" in query or "port" in query:
-            return "embarkation_count"
-        elif "class" in query and "survival" in query:
-            return "survival_by_class"
-        elif "survival" in query or "survived" in query:
-            return "survival_count"
-        elif "correlation" in query:
-            return "correlation_heatmap"
-        elif "age" in query and "fare" in query:
-            return "age_vs_fare"
-        
-        return None
\ No newline at end of file
+        return intent_router.route(query).visualization_type
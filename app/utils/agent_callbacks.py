@@ -0,0 +1,117 @@
+import os
+import sys
+import threading
+import time
+
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.metrics import LLM_CALL_SECONDS, LLM_CALLS, LLM_TOKENS, record_stage
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+DEFAULT_ENCODING = "cl100k_base"
+
+# tiktoken encodings by model name; None when one couldn't be loaded (e.g. offline)
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+def _encoder(model):
+    with _encoders_lock:
+        if model not in _encoders:
+            try:
+                import tiktoken
+                try:
+                    _encoders[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encoders[model] = tiktoken.get_encoding(DEFAULT_ENCODING)
+            except Exception as e:
+                print(f"Warning: estimating LLM token counts, tiktoken encoding unavailable: {str(e)}")
+                _encoders[model] = None
+        return _encoders[model]
+
+def count_tokens(text, model=None):
+    """Tokens in text for the model, or an estimate (4 characters per token) without tiktoken"""
+    encoder = _encoder(model or "")
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+class StreamingAgentCallbackHandler(AsyncCallbackHandler):
+    """Forwards ReAct steps and final-answer tokens to an asyncio queue as (event, data) pairs"""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._text = ""
+        self._emitted = 0
+
+    async def on_llm_start(self, serialized, prompts, **kwargs):
+        self._text = ""
+        self._emitted = 0
+
+    async def on_llm_new_token(self, token, **kwargs):
+        # Only tokens after "Final Answer:" belong to the answer; the rest is the agent's reasoning
+        self._text += token
+        marker = self._text.find(FINAL_ANSWER_MARKER)
+        if marker == -1:
+            return
+        start = max(marker + len(FINAL_ANSWER_MARKER), self._emitted)
+        text = self._text[start:]
+        if start == marker + len(FINAL_ANSWER_MARKER):
+            text = text.lstrip()
+        if text:
+            self._emitted = len(self._text)
+            await self.queue.put(("token", {"text": text}))
+
+    async def on_agent_action(self, action, **kwargs):
+        await self.queue.put(("step", {"tool": action.tool, "tool_input": action.tool_input}))
+
+    async def on_tool_end(self, output, **kwargs):
+        await self.queue.put(("observation", {"observation": str(output)}))
+
+class LLMMetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records the latency and token usage of every LLM call an agent makes.
+    Streamed completions come without usage figures, so their tokens are
+    counted from the prompts and the generated text
+    """
+
+    def __init__(self):
+        self._started = {}
+
+    def on_llm_start(self, serialized, prompts, run_id=None, invocation_params=None, **kwargs):
+        model = (invocation_params or {}).get("model_name") or (invocation_params or {}).get("model")
+        self._started[run_id] = (time.perf_counter(), prompts, model)
+
+    def on_llm_end(self, response, run_id=None, **kwargs):
+        started, prompts, model = self._started.pop(run_id, (None, [], None))
+        if started is not None:
+            seconds = time.perf_counter() - started
+            LLM_CALL_SECONDS.observe(seconds)
+            record_stage("llm", seconds)
+        LLM_CALLS.inc(outcome="success")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage.get("prompt_tokens") and not usage.get("completion_tokens"):
+            usage = {
+                "prompt_tokens": sum(count_tokens(prompt, model) for prompt in prompts),
+                "completion_tokens": sum(
+                    count_tokens(generation.text, model) for generations in response.generations for generation in generations
+                ),
+            }
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.inc(usage[kind], type=kind.replace("_tokens", ""))
+
+    def on_llm_error(self, error, run_id=None, **kwargs):
+        self._started.pop(run_id, None)
+        LLM_CALLS.inc(outcome="error")
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Counts the LLM calls made while answering one query"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.calls += 1
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.agent import TitanicAgent
+from app.utils.metrics import timed
+
+def hash_api_key(api_key):
+    """Return the pool key for an API key; the raw key is never stored as a key"""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+class AgentPool:
+    """
+    Registry of ready-to-use TitanicAgent instances keyed by a hash of the API key.
+
+    Agents are evicted least-recently-used first once the pool exceeds
+    max_size, and whenever they have been idle for longer than idle_ttl
+    seconds. All agents share one pooled HTTP client so connections to the
+    OpenAI API are kept alive between requests, for both sync and async calls.
+    agent_factory builds new agents and can be swapped out, e.g. by benchmarks.
+    """
+
+    def __init__(self, max_size=32, idle_ttl=900, max_connections=20, agent_factory=TitanicAgent):
+        self.max_size = max_size
+        self.agent_factory = agent_factory
+        self.idle_ttl = idle_ttl
+        self.max_connections = max_connections
+        self._agents = OrderedDict()
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._http_async_client = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def http_client(self):
+        """Shared keep-alive HTTP client for all pooled agents"""
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return self._http_client
+
+    @property
+    def http_async_client(self):
+        """Shared keep-alive async HTTP client for all pooled agents"""
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return self._http_async_client
+
+    def _evict_idle(self, now):
+        expired = [key for key, (_, last_used) in self._agents.items() if now - last_used > self.idle_ttl]
+        for key in expired:
+            del self._agents[key]
+            self.evictions += 1
+
+    def get(self, api_key=None):
+        """Return the pooled agent for this API key, creating it on first use"""
+        key = hash_api_key(api_key)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            if key in self._agents:
+                agent, _ = self._agents[key]
+                self._agents[key] = (agent, now)
+                self._agents.move_to_end(key)
+                self.hits += 1
+                return agent
+            self.misses += 1
+            http_client = self.http_client
+            http_async_client = self.http_async_client
+
+        # Build outside the lock so a slow construction doesn't block other keys
+        with timed("agent_init"):
+            agent = self.agent_factory(api_key=api_key, http_client=http_client, http_async_client=http_async_client)
+
+        with self._lock:
+            if key in self._agents:
+                # Another request built the same agent in the meantime
+                agent, _ = self._agents[key]
+            self._agents[key] = (agent, now)
+            self._agents.move_to_end(key)
+            while len(self._agents) > self.max_size:
+                self._agents.popitem(last=False)
+                self.evictions += 1
+        return agent
+
+    def clear(self):
+        """Drop all pooled agents"""
+        with self._lock:
+            self._agents.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._agents),
+                "max_size": self.max_size,
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+agent_pool = AgentPool(
+    max_size=int(os.environ.get("AGENT_POOL_MAX_SIZE", "32")),
+    idle_ttl=float(os.environ.get("AGENT_POOL_IDLE_TTL", "900")),
+    max_connections=int(os.environ.get("AGENT_POOL_MAX_CONNECTIONS", "20")),
+)
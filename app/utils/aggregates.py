@@ -0,0 +1,148 @@
+import itertools
+import math
+import os
+import sys
+import threading
+
+import pandas as pd
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.data_loader import get_dataset_version, get_cached_summary, summarize_counts
+
+# Columns the cube is grouped by and the columns it aggregates
+DIMENSIONS = ('Sex', 'Pclass', 'Embarked')
+MEASURES = ('Survived', 'Fare', 'Age')
+
+def _key_value(value):
+    """Normalize a group key so that lookups work with plain Python values"""
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NA:
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def _empty_stats():
+    stats = {"count": 0}
+    for measure in MEASURES:
+        stats[f"{measure}_count"] = 0
+        stats[f"{measure}_sum"] = 0.0
+    return stats
+
+def _add_stats(target, source):
+    for name, value in source.items():
+        target[name] += value
+
+def _with_means(stats):
+    result = dict(stats)
+    for measure in MEASURES:
+        count = stats[f"{measure}_count"]
+        result[f"{measure}_mean"] = stats[f"{measure}_sum"] / count if count else None
+    return result
+
+def frame_cells(df):
+    """Cube cells ({dimension key: stats}) for a DataFrame or a chunk of one"""
+    named_aggs = {"count": ('Survived', 'size')}
+    for measure in MEASURES:
+        named_aggs[f"{measure}_count"] = (measure, 'count')
+        named_aggs[f"{measure}_sum"] = (measure, 'sum')
+    grouped = df.groupby(list(DIMENSIONS), dropna=False, observed=True).agg(**named_aggs)
+
+    cells = {}
+    for key, row in zip(grouped.index, grouped.to_dict('records')):
+        key = tuple(_key_value(value) for value in key)
+        stats = cells.setdefault(key, _empty_stats())
+        for name in stats:
+            cast = float if name.endswith('_sum') else int
+            stats[name] += cast(row[name])
+    return cells
+
+def merge_cells(target, source):
+    """Add the cells of one partial cube into another"""
+    for key, stats in source.items():
+        _add_stats(target.setdefault(key, _empty_stats()), stats)
+    return target
+
+class AggregateCube:
+    """
+    Counts, sums and means of Survived/Fare/Age for every combination of
+    Sex, Pclass and Embarked, plus per-column missing-value counts.
+
+    All roll-ups (any subset of the dimensions) are materialized when the
+    cube is built, so lookups through cell() and rollup() are dictionary
+    reads that never touch the DataFrame.
+    """
+
+    def __init__(self, cells, missing_values, columns, version=None):
+        self.cells = cells
+        self.missing_values = missing_values
+        self.columns = columns
+        self.version = version
+        self._rollups = self._build_rollups()
+
+    @classmethod
+    def from_frame(cls, df, version=None):
+        """Build a cube from a DataFrame with the Titanic schema"""
+        missing_values = {column: int(count) for column, count in df.isnull().sum().items()}
+        return cls(frame_cells(df), missing_values, list(df.columns), version=version)
+
+    def _build_rollups(self):
+        rollups = {}
+        for size in range(len(DIMENSIONS) + 1):
+            for dims in itertools.combinations(DIMENSIONS, size):
+                positions = [DIMENSIONS.index(dim) for dim in dims]
+                table = {}
+                for key, stats in self.cells.items():
+                    sub_key = tuple(key[position] for position in positions)
+                    _add_stats(table.setdefault(sub_key, _empty_stats()), stats)
+                rollups[dims] = {sub_key: _with_means(stats) for sub_key, stats in table.items()}
+        return rollups
+
+    def cell(self, **filters):
+        """
+        Return the aggregates for one slice, e.g. cell(Sex='male', Pclass=1).
+        Dimensions that are not given are summed over.
+        """
+        unknown = set(filters) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown cube dimension(s): {', '.join(sorted(unknown))}")
+        dims = tuple(dim for dim in DIMENSIONS if dim in filters)
+        key = tuple(filters[dim] for dim in dims)
+        stats = self._rollups[dims].get(key)
+        return dict(stats) if stats else _with_means(_empty_stats())
+
+    def rollup(self, *dims):
+        """Return {group key: aggregates} for the given dimensions"""
+        unknown = set(dims) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown cube dimension(s): {', '.join(sorted(unknown))}")
+        ordered = tuple(dim for dim in DIMENSIONS if dim in dims)
+        table = self._rollups[ordered]
+        if len(ordered) == 1:
+            return {key[0]: dict(stats) for key, stats in table.items()}
+        return {key: dict(stats) for key, stats in table.items()}
+
+    def total(self):
+        """Aggregates over the whole dataset"""
+        return self.cell()
+
+_cube = None
+_cube_lock = threading.Lock()
+
+def get_aggregate_cube():
+    """
+    Returns the aggregate cube for the current dataset version, rebuilding it when the dataset changes
+    """
+    global _cube
+    version = get_dataset_version()
+    cube = _cube
+    if cube is not None and cube.version == version:
+        return cube
+    with _cube_lock:
+        if _cube is None or _cube.version != version:
+            # The full summary (moments, correlation sums, histograms) is far costlier
+            # than the counts, so it's only used when already current, e.g. after an ingest
+            summary = get_cached_summary(version) or summarize_counts()
+            _cube = summary.cube(version=version)
+        return _cube
@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Questions answered at startup so the first users get cached answers
+DEFAULT_WARMUP_QUESTIONS = [
+    "What percentage of passengers were male on the Titanic?",
+    "Show me a histogram of passenger ages",
+    "What was the average ticket fare?",
+    "How many passengers embarked from each port?",
+    "What was the survival rate by passenger class?",
+    "Did women have a higher survival rate than men?",
+]
+
+def normalize_query(text):
+    """Normalize a question so that case, whitespace and punctuation differences share a cache entry"""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+# Response fields that only mean something in the process that computed the
+# answer: result IDs point into that worker's in-memory result store
+UNCACHED_FIELDS = ("results",)
+
+class AnswerCache:
+    """
+    Cache of query responses keyed by normalized question text and dataset version.
+
+    Entries live in a size-bounded in-memory LRU and expire after ttl seconds.
+    When db_path is set, entries are also written to a SQLite database so
+    they survive restarts; memory misses fall back to that tier.
+    """
+
+    def __init__(self, ttl=3600, max_size=1024, db_path=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            self._open_db()
+
+    def _open_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def key(self, query, version, mode="default"):
+        """Cache key for a question; equal keys are interchangeable answers"""
+        return f"{version}|{mode}|{normalize_query(query)}"
+
+    def get(self, query, version, mode="default"):
+        """Return the cached response or None"""
+        key = self.key(query, version, mode)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, created = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(response)
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created FROM answers WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    response = json.loads(row[0])
+                    self._store(key, response, row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return dict(response)
+
+            self.misses += 1
+            return None
+
+    def _store(self, key, response, created):
+        self._entries[key] = (response, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def put(self, query, version, response, mode="default"):
+        """Cache a successful response, without its process-local fields"""
+        if not response.get("success"):
+            return
+        response = {field: value for field, value in response.items() if field not in UNCACHED_FIELDS}
+        key = self.key(query, version, mode)
+        created = time.time()
+        with self._lock:
+            self._store(key, response, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, response, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(response), created),
+                )
+                self._db.execute("DELETE FROM answers WHERE created < ?", (created - self.ttl,))
+                self._db.commit()
+
+    def get_or_compute(self, query, version, compute, mode="default"):
+        """Return the cached response, or compute, cache and return it"""
+        response = self.get(query, version, mode)
+        if response is None:
+            response = compute()
+            self.put(query, version, response, mode)
+        return response
+
+    def warm_up(self, questions, version, compute, mode="default"):
+        """Pre-answer questions that are not cached yet"""
+        for question in questions:
+            try:
+                self.get_or_compute(question, version, lambda: compute(question), mode)
+            except Exception as e:
+                print(f"Warning: could not warm up answer cache for '{question}': {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "persistent": self._db is not None,
+        }
+
+def get_warmup_questions():
+    """
+    Questions to pre-answer at startup: ANSWER_CACHE_WARMUP as a '|'-separated
+    list (empty to disable), or the default example questions
+    """
+    configured = os.environ.get("ANSWER_CACHE_WARMUP")
+    if configured is None:
+        return list(DEFAULT_WARMUP_QUESTIONS)
+    return [question.strip() for question in configured.split("|") if question.strip()]
+
+answer_cache = AnswerCache(
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", "3600")),
+    max_size=int(os.environ.get("ANSWER_CACHE_MAX_SIZE", "1024")),
+    db_path=os.environ.get("ANSWER_CACHE_DB") or None,
+)
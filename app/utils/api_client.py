@@ -0,0 +1,85 @@
+import json
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_ENDPOINT = os.environ.get("API_ENDPOINT", "http://localhost:8000")
+
+def iter_sse_events(response):
+    """Parse a Server-Sent Events response into (event, data) pairs"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+            continue
+        if data_lines:
+            yield event, json.loads("\n".join(data_lines))
+        event, data_lines = "message", []
+
+class TitanicAPIClient:
+    """
+    Client for the FastAPI backend. All calls go through one requests.Session
+    with a keep-alive connection pool, so reruns of the Streamlit script reuse
+    open connections instead of reconnecting for every request.
+    """
+
+    def __init__(self, base_url=API_ENDPOINT, pool_size=10, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _url(self, path):
+        return f"{self.base_url}{path}"
+
+    def dataset_info(self):
+        response = self.session.get(self._url("/dataset-info"), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def stream_query(self, query, api_key=None):
+        """Yield the (event, data) pairs of /query/stream"""
+        payload = {"query": query, "api_key": api_key or None}
+        with self.session.post(self._url("/query/stream"), json=payload, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise requests.HTTPError(f"Error from API: {response.text}", response=response)
+            yield from iter_sse_events(response)
+
+    def chart_spec(self, visualization_type, etag=None):
+        """
+        Fetch a chart's Plotly JSON spec. Returns (etag, spec), or (etag, None)
+        when the server answers 304 because the given ETag is still current
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+        response = self.session.get(
+            self._url(f"/visualization/{visualization_type}"), headers=headers, timeout=self.timeout
+        )
+        if response.status_code == 304:
+            return etag, None
+        response.raise_for_status()
+        return response.headers.get("ETag"), response.text
+
+    def passengers(self, offset=0, limit=50, filter=None):
+        """One page of raw passenger records; see GET /passengers"""
+        params = {"offset": offset, "limit": limit}
+        if filter:
+            params["filter"] = filter
+        response = self.session.get(self._url("/passengers"), params=params, timeout=self.timeout)
+        if response.status_code == 400:
+            raise ValueError(response.json().get("detail", response.text))
+        response.raise_for_status()
+        return response.json()
+
+    def result_page(self, result_id, offset=0, limit=1000):
+        """One page of a full query result as columnar JSON; see GET /results/{id}"""
+        response = self.session.get(
+            self._url(f"/results/{result_id}"), params={"offset": offset, "limit": limit}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
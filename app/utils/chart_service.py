@@ -0,0 +1,70 @@
+import gzip
+import hashlib
+import os
+import sys
+import threading
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.data_loader import get_dataset_version
+
+# Plot function (in app.utils.visualizations) for each visualization type returned by the agent
+VISUALIZATION_TYPES = {
+    "age_histogram": "plot_age_histogram",
+    "fare_histogram": "plot_fare_histogram",
+    "gender_distribution": "plot_gender_distribution",
+    "embarkation_count": "plot_embarkation_count",
+    "survival_by_class": "plot_survival_by_class",
+    "survival_count": "plot_survival_count",
+    "age_vs_fare": "plot_age_vs_fare",
+    "correlation_heatmap": "plot_correlation_heatmap",
+}
+
+class ChartSpec:
+    """Serialized Plotly figure JSON with its gzip encoding and ETag"""
+
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        self.gzip_body = gzip.compress(body)
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+class ChartService:
+    """
+    Builds each chart's Plotly JSON spec once per dataset version and keeps
+    the serialized bytes, so repeat requests never rebuild a figure
+    """
+
+    def __init__(self):
+        self._specs = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, visualization_type):
+        """Return the ChartSpec for a visualization type, building it if needed"""
+        if visualization_type not in VISUALIZATION_TYPES:
+            raise KeyError(visualization_type)
+        version = get_dataset_version()
+        spec = self._specs.get(visualization_type)
+        if spec is not None and spec.version == version:
+            self.hits += 1
+            return spec
+        with self._lock:
+            spec = self._specs.get(visualization_type)
+            if spec is None or spec.version != version:
+                # Plotly is imported with the first chart rather than at startup
+                from app.utils import visualizations
+                fig = getattr(visualizations, VISUALIZATION_TYPES[visualization_type])()
+                spec = ChartSpec(version, fig.to_json().encode("utf-8"))
+                self._specs[visualization_type] = spec
+                self.builds += 1
+            else:
+                self.hits += 1
+            return spec
+
+    def stats(self):
+        return {"cached": len(self._specs), "builds": self.builds, "hits": self.hits}
+
+chart_service = ChartService()
@@ -1,44 +1,816 @@
+import copy
+import io
+import numpy as np
 import pandas as pd
 import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-def load_titanic_dataset():
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # snapshots are an optimization, plain CSV still works
+    pa = None
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.metrics import timed
+from app.utils.shared_dataset import SharedDatasetStore, FileLock
+
+DATA_PATH = os.path.join('app', 'data', 'titanic.csv')
+DATASET_URL = "https://raw.githubusercontent.com/datasciencedojo/datasets/master/titanic.csv"
+SNAPSHOT_SIGNATURE_KEY = b"titanic.source_signature"
+
+TITANIC_COLUMNS = (
+    'PassengerId', 'Survived', 'Pclass', 'Name', 'Sex', 'Age',
+    'SibSp', 'Parch', 'Ticket', 'Fare', 'Cabin', 'Embarked',
+)
+
+# Explicit column types: low-cardinality columns become categoricals, integer
+# columns are downcast to the smallest type that fits, free text uses Arrow strings
+CATEGORICAL_COLUMNS = ('Sex', 'Embarked')
+INTEGER_COLUMNS = ('PassengerId', 'Survived', 'Pclass', 'SibSp', 'Parch')
+FLOAT_COLUMNS = ('Age', 'Fare')
+STRING_COLUMNS = ('Name', 'Ticket', 'Cabin')
+STRING_DTYPE = pd.StringDtype('pyarrow') if pa is not None else object
+
+def _smallest_integer_dtype(series):
+    """The narrowest signed integer dtype that holds the series' values"""
+    if series.empty:
+        return series.dtype
+    low, high = series.min(), series.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def apply_schema(df):
     """
-    Loads the Titanic dataset from local storage or downloads it if not available
+    Converts a raw Titanic DataFrame to the compact schema. Columns that are
+    already typed are left alone (not copied), so a memory-mapped snapshot
+    stays mapped.
+    """
+    for column in df.columns:
+        series = df[column]
+        if column in CATEGORICAL_COLUMNS:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                df[column] = series.astype('category')
+        elif column in INTEGER_COLUMNS:
+            if pd.api.types.is_integer_dtype(series.dtype):
+                smallest = _smallest_integer_dtype(series)
+                if smallest.itemsize < series.dtype.itemsize:
+                    df[column] = series.astype(smallest)
+        elif column in FLOAT_COLUMNS:
+            if series.dtype != 'float64':
+                df[column] = series.astype('float64')
+        elif column in STRING_COLUMNS:
+            if series.dtype != STRING_DTYPE:
+                df[column] = series.astype(STRING_DTYPE)
+    return df
+
+def memory_footprint(df):
+    """
+    Returns the dtype and memory usage in bytes of every column, and the total
+    """
+    usage = df.memory_usage(index=True, deep=True)
+    return {
+        "total_bytes": int(usage.sum()),
+        "columns": {
+            column: {"dtype": str(df[column].dtype), "bytes": int(usage[column])}
+            for column in df.columns
+        },
+    }
+
+def _snapshot_path(data_path):
+    """Path of the Arrow snapshot stored next to the CSV file"""
+    return os.path.splitext(data_path)[0] + '.arrow'
+
+def _format_version(mtime_ns, size):
+    return f"{size:x}-{mtime_ns:x}"
+
+def _source_signature(data_path):
+    stat = os.stat(data_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}".encode()
+
+def _load_snapshot(data_path):
+    """
+    Memory-maps the Arrow snapshot of the CSV if it exists and is up to date.
+    Returns None when the snapshot is missing, stale or unreadable.
+    """
+    snapshot_path = _snapshot_path(data_path)
+    if pa is None or not os.path.exists(snapshot_path):
+        return None
+    try:
+        source = pa.memory_map(snapshot_path, 'r')
+        reader = pa.ipc.open_file(source)
+        metadata = reader.schema.metadata or {}
+        if metadata.get(SNAPSHOT_SIGNATURE_KEY) != _source_signature(data_path):
+            return None
+        # split_blocks keeps numeric columns backed by the mapped file
+        return apply_schema(reader.read_all().to_pandas(split_blocks=True))
+    except (OSError, pa.ArrowException) as e:
+        print(f"Warning: ignoring unreadable dataset snapshot: {str(e)}")
+        return None
+
+def _write_snapshot(df, data_path):
+    """
+    Writes an uncompressed Arrow snapshot of the dataset so it can be mapped without copying
+    """
+    if pa is None:
+        return
+    snapshot_path = _snapshot_path(data_path)
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[SNAPSHOT_SIGNATURE_KEY] = _source_signature(data_path)
+        feather.write_feather(table.replace_schema_metadata(metadata), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, snapshot_path)
+    except (OSError, pa.ArrowException) as e:
+        print(f"Warning: could not write dataset snapshot: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _read_dataset(data_path):
+    """
+    Reads the Titanic dataset from disk, downloading it first if not available
     """
-    data_path = os.path.join('app', 'data', 'titanic.csv')
-    
     # Check if dataset already exists
     if os.path.exists(data_path):
-        return pd.read_csv(data_path)
-    
+        df = _load_snapshot(data_path)
+        if df is None:
+            df = apply_schema(pd.read_csv(data_path))
+            _write_snapshot(df, data_path)
+        return df
+
     # If not, download from a reliable source
-    url = "https://raw.githubusercontent.com/datasciencedojo/datasets/master/titanic.csv"
-    df = pd.read_csv(url)
-    
+    df = apply_schema(pd.read_csv(DATASET_URL))
+
     # Save locally for future use
     os.makedirs(os.path.dirname(data_path), exist_ok=True)
     df.to_csv(data_path, index=False)
-    
+    _write_snapshot(df, data_path)
+
     return df
 
+class DatasetCache:
+    """
+    Process-wide cache for the Titanic DataFrame.
+
+    The CSV is parsed once and re-read only when its mtime or size changes.
+    Callers receive a shallow copy, so adding or replacing columns never
+    touches the cached frame; values must not be modified in place.
+    """
+
+    def __init__(self, data_path=DATA_PATH):
+        self.data_path = data_path
+        self._lock = threading.Lock()
+        self._df = None
+        self._signature = None
+        self._memory = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.data_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        with timed("dataset_load"):
+            self._df = _read_dataset(self.data_path)
+        self._signature = self._file_signature()
+        self._memory = None
+        self.reloads += 1
+
+    def get(self):
+        """Return a read-only view of the dataset, reloading it if the file changed"""
+        signature = self._file_signature()
+        with self._lock:
+            if self._df is not None and signature is not None and signature == self._signature:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._load()
+            df = self._df
+        return df.copy(deep=False)
+
+    def append(self, batch, previous_signature):
+        """
+        Add rows that were just appended to the file to the cached frame, so
+        it doesn't have to be re-read. If the cache wasn't current before the
+        append, the next get() reloads it instead.
+        """
+        with self._lock:
+            if self._df is None or self._signature != previous_signature:
+                return
+            df = self._df
+            batch = apply_schema(batch.copy())
+            for column in CATEGORICAL_COLUMNS:
+                # Concatenating categoricals only keeps the dtype when the categories agree
+                categories = df[column].cat.categories.union(batch[column].cat.categories)
+                df = df.assign(**{column: df[column].cat.set_categories(categories)})
+                batch[column] = batch[column].cat.set_categories(categories)
+            self._df = apply_schema(pd.concat([df, batch[list(df.columns)]], ignore_index=True))
+            self._signature = self._file_signature()
+            self._memory = None
+
+    def reload(self):
+        """Force the dataset to be re-read from disk"""
+        with self._lock:
+            self._load()
+            df = self._df
+        return df.copy(deep=False)
+
+    def memory_usage(self):
+        """Memory footprint of the cached dataset, measured once per load"""
+        df = self.get()
+        with self._lock:
+            if self._memory is None:
+                self._memory = memory_footprint(df)
+            return self._memory
+
+    @property
+    def version(self):
+        """Identifier of the currently cached dataset contents"""
+        if self._signature is None:
+            return None
+        mtime_ns, size = self._signature
+        return _format_version(mtime_ns, size)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "reloads": self.reloads,
+            "version": self.version,
+        }
+
+class SharedDatasetCache(DatasetCache):
+    """
+    Dataset cache backed by a segment in shared memory, for running several
+    API workers without a private copy of the data in each.
+
+    Workers attach to the published segment zero-copy and re-attach when the
+    pointer to it changes. Whichever process first notices the CSV is newer
+    than the published segment re-publishes it, under a cross-process lock.
+    """
+
+    def __init__(self, data_path=DATA_PATH, store=None):
+        super().__init__(data_path)
+        self.store = store or SharedDatasetStore()
+        self._segment = None
+
+    def _file_signature(self):
+        return (super()._file_signature(), self.store.pointer_signature())
+
+    def _csv_signature(self):
+        return _source_signature(self.data_path) if os.path.exists(self.data_path) else None
+
+    def _is_current(self, segment):
+        return segment is not None and segment.source_signature == self._csv_signature()
+
+    def _publish(self):
+        df = _read_dataset(self.data_path)
+        stat = os.stat(self.data_path)
+        self.store.publish(df, _format_version(stat.st_mtime_ns, stat.st_size), _source_signature(self.data_path))
+
+    def _load(self, force=False):
+        with timed("dataset_load"):
+            signature = self._file_signature()
+            segment = self.store.attach()
+            if force or not self._is_current(segment):
+                with self.store.publish_lock():
+                    # Another worker may have published while we waited for the lock
+                    segment = self.store.attach()
+                    if force or not self._is_current(segment):
+                        self._publish()
+                    signature = self._file_signature()
+                    segment = self.store.attach()
+            self._segment = segment
+            self._df = apply_schema(segment.df)
+        self._signature = signature
+        self._memory = None
+        self.reloads += 1
+
+    def append(self, batch, previous_signature):
+        # The CSV is now newer than the segment, so the next get() republishes it
+        pass
+
+    def reload(self):
+        """Re-read the CSV and publish it as a new segment for every worker"""
+        with self._lock:
+            self._load(force=True)
+            df = self._df
+        return df.copy(deep=False)
+
+    @property
+    def version(self):
+        return self._segment.version if self._segment is not None else None
+
+    def stats(self):
+        stats = super().stats()
+        stats["shared_memory"] = {
+            "directory": self.store.directory,
+            "segment": self._segment.name if self._segment is not None else None,
+        }
+        return stats
+
+def _make_cache(data_path=DATA_PATH):
+    # DATASET_SHARED_MEMORY=1 shares one copy of the data between uvicorn workers
+    if os.environ.get("DATASET_SHARED_MEMORY", "0") == "1":
+        return SharedDatasetCache(data_path)
+    return DatasetCache(data_path)
+
+_dataset_cache = _make_cache()
+
+def set_data_path(data_path):
+    """
+    Points the process-wide dataset cache at another CSV file (used by benchmarks)
+    """
+    global _dataset_cache
+    _dataset_cache = _make_cache(data_path)
+
+def publish_shared_dataset(data_path=DATA_PATH):
+    """
+    Loads the dataset and publishes it to shared memory for the API workers,
+    returning the segment name
+    """
+    cache = SharedDatasetCache(data_path)
+    cache.reload()
+    return cache.stats()["shared_memory"]["segment"]
+
+def load_titanic_dataset():
+    """
+    Loads the Titanic dataset from local storage or downloads it if not available
+    """
+    return _dataset_cache.get()
+
+def reload_dataset():
+    """
+    Discards the cached dataset and reads it again from disk
+    """
+    return _dataset_cache.reload()
+
+def get_dataset_version():
+    """
+    Returns a token that changes whenever the dataset file changes
+    """
+    if is_streaming():
+        # Identify the file without loading it
+        stat = os.stat(_dataset_cache.data_path)
+        return _format_version(stat.st_mtime_ns, stat.st_size)
+    _dataset_cache.get()
+    return _dataset_cache.version
+
+def get_cache_stats():
+    """
+    Returns hit/miss counters for the dataset cache
+    """
+    return _dataset_cache.stats()
+
+# Out-of-core aggregation. DATASET_STREAMING=auto switches to it for CSV files of
+# at least DATASET_STREAMING_MIN_MB; 1 always uses it and 0 never does
+STREAMING_MODE = os.environ.get("DATASET_STREAMING", "auto")
+STREAMING_MIN_BYTES = int(float(os.environ.get("DATASET_STREAMING_MIN_MB", "2048")) * 2 ** 20)
+CHUNK_ROWS = int(os.environ.get("DATASET_CHUNK_ROWS", "250000"))
+STREAMING_WORKERS = int(os.environ.get("DATASET_STREAMING_WORKERS", "1"))
+
+NUMERIC_COLUMNS = tuple(column for column in TITANIC_COLUMNS if column in INTEGER_COLUMNS + FLOAT_COLUMNS)
+# Fixed bin edges, so that histograms of different chunks can simply be added;
+# values outside the range are counted in the first or last bin
+HISTOGRAM_EDGES = {
+    'Age': np.linspace(0, 100, 41),
+    'Fare': np.linspace(0, 600, 61),
+}
+
+def _float_values(df, column):
+    return df[column].to_numpy(dtype='float64', na_value=np.nan)
+
+def _clipped(values, edges):
+    return np.clip(values, edges[0], edges[-1])
+
+class DatasetSummary:
+    """
+    Mergeable partial aggregates of the dataset: row and missing-value counts,
+    the aggregate cube cells, mean/variance of every numeric column, pairwise
+    sums for correlations, and fixed-bin histograms.
+
+    Summaries of separate chunks combine with merge(), in any order, into the
+    summary of the whole dataset, so it can be computed in bounded memory.
+    """
+
+    def __init__(self):
+        k = len(NUMERIC_COLUMNS)
+        self.rows = 0
+        self.columns = None
+        self.missing_values = {}
+        self.cells = {}
+        # (count, mean, sum of squared deviations) per numeric column
+        self.moments = {column: (0, 0.0, 0.0) for column in NUMERIC_COLUMNS}
+        # Sums over the rows where both columns of a pair are present
+        self.pair_count = np.zeros((k, k))
+        self.pair_sum = np.zeros((k, k))
+        self.pair_sum_squares = np.zeros((k, k))
+        self.cross_sum = np.zeros((k, k))
+        self.histograms = {column: np.zeros(len(edges) - 1, dtype=np.int64) for column, edges in HISTOGRAM_EDGES.items()}
+        self.histogram2d = np.zeros((len(HISTOGRAM_EDGES['Age']) - 1, len(HISTOGRAM_EDGES['Fare']) - 1), dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, df, counts_only=False):
+        """
+        Summarize one DataFrame (typically a chunk of the source file). With
+        counts_only, just the row and missing-value counts and the cube cells
+        """
+        # Imported here because the aggregates module builds on this one
+        from app.utils.aggregates import frame_cells
+
+        summary = cls()
+        summary.rows = len(df)
+        summary.columns = list(df.columns)
+        summary.missing_values = {column: int(count) for column, count in df.isnull().sum().items()}
+        summary.cells = frame_cells(df)
+        if counts_only:
+            return summary
+
+        values = np.column_stack([_float_values(df, column) for column in NUMERIC_COLUMNS])
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        mask = present.astype('float64')
+        summary.pair_count = mask.T @ mask
+        summary.pair_sum = filled.T @ mask
+        summary.pair_sum_squares = (filled ** 2).T @ mask
+        summary.cross_sum = filled.T @ filled
+        for i, column in enumerate(NUMERIC_COLUMNS):
+            column_values = values[present[:, i], i]
+            if len(column_values):
+                mean = column_values.mean()
+                summary.moments[column] = (len(column_values), mean, float(((column_values - mean) ** 2).sum()))
+
+        for column, edges in HISTOGRAM_EDGES.items():
+            column_values = _float_values(df, column)
+            column_values = column_values[~np.isnan(column_values)]
+            summary.histograms[column] = np.histogram(_clipped(column_values, edges), bins=edges)[0]
+        age, fare = _float_values(df, 'Age'), _float_values(df, 'Fare')
+        both = ~(np.isnan(age) | np.isnan(fare))
+        summary.histogram2d = np.histogram2d(
+            _clipped(age[both], HISTOGRAM_EDGES['Age']),
+            _clipped(fare[both], HISTOGRAM_EDGES['Fare']),
+            bins=[HISTOGRAM_EDGES['Age'], HISTOGRAM_EDGES['Fare']],
+        )[0].astype(np.int64)
+        return summary
+
+    def merge(self, other):
+        """Add another summary into this one and return self"""
+        # Imported here because the aggregates module builds on this one
+        from app.utils.aggregates import merge_cells
+
+        self.rows += other.rows
+        self.columns = self.columns or other.columns
+        for column, count in other.missing_values.items():
+            self.missing_values[column] = self.missing_values.get(column, 0) + count
+        merge_cells(self.cells, other.cells)
+        for column in NUMERIC_COLUMNS:
+            # Chan et al. parallel update of mean and squared deviations
+            count_a, mean_a, m2_a = self.moments[column]
+            count_b, mean_b, m2_b = other.moments[column]
+            count = count_a + count_b
+            if count_b:
+                delta = mean_b - mean_a
+                self.moments[column] = (
+                    count,
+                    mean_a + delta * count_b / count,
+                    m2_a + m2_b + delta ** 2 * count_a * count_b / count,
+                )
+        self.pair_count += other.pair_count
+        self.pair_sum += other.pair_sum
+        self.pair_sum_squares += other.pair_sum_squares
+        self.cross_sum += other.cross_sum
+        for column in self.histograms:
+            self.histograms[column] += other.histograms[column]
+        self.histogram2d += other.histogram2d
+        return self
+
+    def mean(self, column):
+        count, mean, _ = self.moments[column]
+        return mean if count else None
+
+    def variance(self, column):
+        """Sample variance (ddof=1), like pandas"""
+        count, _, m2 = self.moments[column]
+        return m2 / (count - 1) if count > 1 else None
+
+    def correlation(self):
+        """Pairwise Pearson correlations of the numeric columns, like DataFrame.corr()"""
+        n, sx = self.pair_count, self.pair_sum
+        sy, sxx = sx.T, self.pair_sum_squares
+        syy = sxx.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = n * self.cross_sum - sx * sy
+            scale = np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+            corr = np.clip(covariance / scale, -1.0, 1.0)
+        corr[n < 2] = np.nan
+        return pd.DataFrame(corr, index=list(NUMERIC_COLUMNS), columns=list(NUMERIC_COLUMNS))
+
+    def histogram(self, column):
+        """(counts, bin edges) of a column"""
+        return self.histograms[column], HISTOGRAM_EDGES[column]
+
+    def cube(self, version=None):
+        """Aggregate cube built from the merged cells"""
+        # Imported here because the aggregates module builds on this one
+        from app.utils.aggregates import AggregateCube
+
+        return AggregateCube(self.cells, dict(self.missing_values), list(self.columns or TITANIC_COLUMNS), version=version)
+
+def summarize_dataset(data_path=None, chunk_rows=CHUNK_ROWS, workers=STREAMING_WORKERS, counts_only=False):
+    """
+    Computes the DatasetSummary of a CSV file chunk by chunk, optionally
+    spreading chunks over a process pool. At most two chunks per worker are
+    held in memory at a time. counts_only is passed on to from_frame().
+    """
+    data_path = data_path or _dataset_cache.data_path
+    summary = DatasetSummary()
+    # Raw chunks: the summary doesn't need the compact schema
+    chunks = pd.read_csv(data_path, chunksize=chunk_rows)
+    if workers <= 1:
+        for chunk in chunks:
+            summary.merge(DatasetSummary.from_frame(chunk, counts_only))
+        return summary
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(DatasetSummary.from_frame, chunk, counts_only))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    summary.merge(future.result())
+        for future in pending:
+            summary.merge(future.result())
+    return summary
+
+def is_streaming(data_path=None):
+    """
+    Whether statistics are computed chunk by chunk instead of from the in-memory dataset
+    """
+    if STREAMING_MODE in ("0", "1"):
+        return STREAMING_MODE == "1"
+    try:
+        return os.path.getsize(data_path or _dataset_cache.data_path) >= STREAMING_MIN_BYTES
+    except OSError:
+        return False
+
+_summary = None
+_summary_lock = threading.Lock()
+
+def get_dataset_summary():
+    """
+    Returns the chunked DatasetSummary for the current dataset version, recomputing it when the file changes
+    """
+    global _summary
+    version = get_dataset_version()
+    with _summary_lock:
+        if _summary is None or _summary[0] != version:
+            if is_streaming():
+                summary = summarize_dataset()
+            else:
+                summary = DatasetSummary.from_frame(load_titanic_dataset())
+            _summary = (version, summary)
+        return _summary[1]
+
+def get_cached_summary(version):
+    """The DatasetSummary of `version` if it has already been computed, else None; never computes it"""
+    summary = _summary
+    return summary[1] if summary is not None and summary[0] == version else None
+
+def get_cached_summary(version):
+    """The DatasetSummary of `version` if it has already been computed, else None; never computes it"""
+    summary = _summary
+    return summary[1] if summary is not None and summary[0] == version else None
+
+def summarize_counts():
+    """
+    A DatasetSummary with only the counts and cube cells filled in, for the
+    current dataset; much cheaper than get_dataset_summary() on a cold start
+    """
+    if is_streaming():
+        return summarize_dataset(counts_only=True)
+    return DatasetSummary.from_frame(load_titanic_dataset(), counts_only=True)
+
+# Columns every ingested record must have; the rest may be missing. Integer
+# columns are all required: a single empty value would turn them into floats
+REQUIRED_INGEST_COLUMNS = ('PassengerId', 'Survived', 'Pclass', 'Sex', 'SibSp', 'Parch')
+ALLOWED_VALUES = {
+    'Survived': {0, 1},
+    'Pclass': {1, 2, 3},
+    'Sex': {'male', 'female'},
+    'Embarked': {'C', 'Q', 'S'},
+}
+
+# Inclusive bounds for ingested numbers; integers must also fit the int32 the
+# columns are read back as, or casting would wrap them around
+INTEGER_RANGE = (0, int(np.iinfo(np.int32).max))
+FLOAT_MINIMUM = 0.0
+
+class IngestError(ValueError):
+    """
+    Raised when ingested records don't fit the dataset schema. `row` (the
+    record's position in the batch) and `column` locate a bad value
+    """
+
+    def __init__(self, message, row=None, column=None):
+        if column is not None:
+            location = f"column '{column}'" if row is None else f"row {row}, column '{column}'"
+            message = f"{message} ({location})"
+        super().__init__(message)
+        self.row = row
+        self.column = column
+
+def _check_column(batch, column, invalid, message):
+    """Raise IngestError for the first record where `invalid` is set"""
+    if invalid.any():
+        row = invalid.idxmax()
+        value = batch.at[row, column]
+        if isinstance(value, np.generic):
+            value = value.item()
+        if not (pd.api.types.is_scalar(value) and pd.isnull(value)):
+            message = f"{message}, got {value!r}"
+        raise IngestError(message, int(row), column)
+
+def parse_records(records):
+    """
+    Validates passenger records (a list of dicts, CSV text or a DataFrame)
+    and returns them as a DataFrame with the dataset's columns
+    """
+    if isinstance(records, str):
+        try:
+            records = pd.read_csv(io.StringIO(records))
+        except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+            raise IngestError(f"Could not parse CSV records: {str(e)}")
+    if not isinstance(records, pd.DataFrame):
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise IngestError("Records must be a list of objects")
+        records = pd.DataFrame(records)
+    batch = records.reset_index(drop=True)
+    if batch.empty:
+        raise IngestError("No records to ingest")
+
+    unknown = set(batch.columns) - set(TITANIC_COLUMNS)
+    if unknown:
+        raise IngestError(f"Unknown column(s): {', '.join(sorted(map(str, unknown)))}")
+    missing = [column for column in REQUIRED_INGEST_COLUMNS if column not in batch.columns]
+    if missing:
+        raise IngestError(f"Missing required column(s): {', '.join(missing)}")
+    batch = batch.reindex(columns=list(TITANIC_COLUMNS))
+
+    for column in TITANIC_COLUMNS:
+        # A list or object would be saved as its repr
+        _check_column(batch, column, ~batch[column].map(pd.api.types.is_scalar), "Value must be a scalar")
+    for column in REQUIRED_INGEST_COLUMNS:
+        _check_column(batch, column, batch[column].isnull(), "Value can't be empty")
+    for column in INTEGER_COLUMNS + FLOAT_COLUMNS:
+        values = pd.to_numeric(batch[column], errors='coerce')
+        _check_column(batch, column, values.isnull() & batch[column].notnull(), "Value must be numeric")
+        _check_column(batch, column, values.notnull() & ~np.isfinite(values.astype('float64')), "Value must be finite")
+        batch[column] = values
+    low, high = INTEGER_RANGE
+    for column in INTEGER_COLUMNS:
+        values = batch[column]
+        _check_column(batch, column, values % 1 != 0, "Value must be a whole number")
+        _check_column(batch, column, (values < low) | (values > high), f"Value must be between {low} and {high}")
+        # Written to the CSV as 3, not 3.0, so the column still loads as integers
+        batch[column] = values.astype('int64')
+    for column in FLOAT_COLUMNS:
+        _check_column(batch, column, batch[column] < FLOAT_MINIMUM, f"Value must be at least {FLOAT_MINIMUM:g}")
+    _check_column(batch, 'PassengerId', batch['PassengerId'].duplicated(), "Duplicate PassengerId in the batch")
+    for column, allowed in ALLOWED_VALUES.items():
+        message = f"Value must be one of {', '.join(map(str, sorted(allowed)))}"
+        _check_column(batch, column, batch[column].notnull() & ~batch[column].isin(allowed), message)
+    return batch
+
+def _check_new_ids(batch):
+    """Reject records whose PassengerId is already in the dataset"""
+    ids = set(batch['PassengerId'])
+    if is_streaming():
+        existing = set()
+        for chunk in pd.read_csv(_dataset_cache.data_path, usecols=['PassengerId'], chunksize=CHUNK_ROWS):
+            existing.update(ids.intersection(chunk['PassengerId']))
+    else:
+        existing = ids.intersection(load_titanic_dataset()['PassengerId'])
+    if existing:
+        raise IngestError(f"PassengerId(s) already in the dataset: {', '.join(map(str, sorted(existing)[:20]))}")
+
+def _append_csv(batch, data_path):
+    """Append rows to the CSV in its own column order and flush them to disk"""
+    with open(data_path, 'rb+') as f:
+        header = f.readline().decode().strip().split(',')
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        f.write(batch[header].to_csv(header=False, index=False).encode())
+        f.flush()
+        os.fsync(f.fileno())
+
+_ingest_lock = threading.Lock()
+
+def append_records(records):
+    """
+    Appends passenger records to the dataset file and folds them into the
+    running statistics. Only the new batch is summarized, so dataset info,
+    keyword answers and charts reflect the new rows in O(batch) time.
+    Returns the number of rows appended and the new dataset version.
+    """
+    global _summary
+    batch = parse_records(records)
+    data_path = _dataset_cache.data_path
+    with _ingest_lock, FileLock(f"{data_path}.lock"):
+        if not os.path.exists(data_path):
+            load_titanic_dataset()
+        _check_new_ids(batch)
+        summary = get_dataset_summary()
+        previous_signature = _dataset_cache._signature
+
+        _append_csv(batch, data_path)
+        stat = os.stat(data_path)
+        version = _format_version(stat.st_mtime_ns, stat.st_size)
+
+        # Readers may hold the current summary, so merge into a copy
+        updated = copy.deepcopy(summary).merge(DatasetSummary.from_frame(batch))
+        with _summary_lock:
+            _summary = (version, updated)
+        _dataset_cache.append(batch, previous_signature)
+    return {"appended": len(batch), "total_passengers": updated.rows, "version": version}
+
+def get_passengers(offset=0, limit=50, mask=None):
+    """
+    Returns one page of passenger records (optionally only the rows selected
+    by mask, a function from DataFrame to boolean Series) and the total number
+    of matching rows. Streamed datasets are scanned chunk by chunk until the
+    page is full, so the total is None for them.
+    """
+    if not is_streaming():
+        df = load_titanic_dataset()
+        if mask is not None:
+            df = df[mask(df)]
+        return df.iloc[offset:offset + limit], len(df)
+
+    pages, skip, needed = [], offset, limit
+    for chunk in pd.read_csv(_dataset_cache.data_path, chunksize=CHUNK_ROWS):
+        chunk = apply_schema(chunk)
+        if mask is not None:
+            chunk = chunk[mask(chunk)]
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        pages.append(chunk.iloc[skip:skip + needed])
+        needed -= len(pages[-1])
+        skip = 0
+        if needed <= 0:
+            break
+    page = pd.concat(pages) if pages else pd.DataFrame(columns=list(TITANIC_COLUMNS))
+    return page, None
+
+def get_memory_usage():
+    """
+    Returns per-column and total memory usage of the loaded dataset
+    """
+    return _dataset_cache.memory_usage()
+
 def get_dataset_info():
     """
     Returns basic information about the Titanic dataset
     """
-    df = load_titanic_dataset()
-    
+    # Imported here because the aggregates module builds on this one
+    from app.utils.aggregates import get_aggregate_cube
+
+    cube = get_aggregate_cube()
+    totals = cube.total()
+
     info = {
-        "total_passengers": len(df),
-        "survived_count": df['Survived'].sum(),
-        "survival_rate": f"{(df['Survived'].mean() * 100):.2f}%",
-        "features": list(df.columns),
-        "missing_values": df.isnull().sum().to_dict()
+        "total_passengers": totals["count"],
+        "survived_count": int(totals["Survived_sum"]),
+        "survival_rate": f"{(totals['Survived_mean'] * 100):.2f}%",
+        "features": list(cube.columns),
+        "missing_values": dict(cube.missing_values),
+        # The dataset is never fully loaded when statistics are streamed
+        "memory_usage": None if is_streaming() else get_memory_usage(),
     }
-    
+
     return info
 
 if __name__ == "__main__":
     # Test the function
     df = load_titanic_dataset()
     print(f"Dataset loaded with {len(df)} rows and {len(df.columns)} columns")
-    print(df.head())
\ No newline at end of file
+    print(df.head())
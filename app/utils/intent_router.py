@@ -0,0 +1,290 @@
+import os
+import re
+import threading
+from collections import Counter
+
+# Label for questions that need the LLM agent
+OTHER = "other"
+
+# Keyword features, matched in a single pass by one compiled alternation
+KEYWORD_FEATURES = {
+    # Aggregates other than the precomputed averages, counts and rates
+    "statistic": r"max\w*|min\w*|highest|lowest|cheapest|expensive|largest|smallest|biggest|oldest|youngest|"
+                 r"total|sum|median|std|standard deviation|deviation|variance|range|quartiles?|percentiles?",
+    # A single port or class, listed before "embark" so that the first match wins
+    "port": r"cherbourg|queenstown|southampton",
+    "class_name": r"first|second|third|1st|2nd|3rd",
+    "sex": r"genders?|sex|males?|females?|men|women|man|woman",
+    "percentage": r"percent|percentage|proportion|share|fraction|ratio",
+    "age": r"ages?|aged|old|young",
+    "distribution": r"histogram|distribution|distributed|spread",
+    "fare": r"fares?|tickets?|prices?|paid|pay|cost",
+    "average": r"average|mean|typical",
+    "embark": r"embark\w*|ports?|boarded",
+    "class": r"p?class|classes",
+    "survival": r"surviv\w*|died|perish\w*|death|deaths",
+    "correlation": r"correlat\w*|heatmap",
+}
+_KEYWORD_PATTERN = re.compile(
+    "|".join(f"(?P<{name}>\\b(?:{pattern})\\b)" for name, pattern in KEYWORD_FEATURES.items())
+)
+
+# Intents that can be answered from precomputed aggregates, with the
+# keyword features that identify them. The most specific satisfied rule wins.
+# Age and fare rules name their measure: "maximum fare" is not the average fare
+INTENT_RULES = [
+    ("gender_distribution", {"sex"}),
+    ("gender_distribution", {"sex", "percentage"}),
+    ("age_distribution", {"age", "distribution"}),
+    ("age_distribution", {"age", "average"}),
+    ("average_fare", {"fare", "average"}),
+    ("average_fare", {"fare", "distribution"}),
+    ("embarkation", {"embark"}),
+    ("survival_by_class", {"survival", "class"}),
+    ("survival_by_gender", {"survival", "sex"}),
+    ("survival_overall", {"survival"}),
+    ("survival_overall", {"survival", "percentage"}),
+]
+
+# Features that narrow a question to a subset of passengers or ask for another
+# statistic. An intent's aggregate only answers the question when its rule
+# names all of them ("average age of survivors" is not the overall average
+# age); no rule names statistic, port or class_name
+FILTER_FEATURES = {"sex", "class", "embark", "survival", "statistic", "port", "class_name"}
+
+INTENT_VISUALIZATIONS = {
+    "gender_distribution": "gender_distribution",
+    "age_distribution": "age_histogram",
+    "average_fare": "fare_histogram",
+    "embarkation": "embarkation_count",
+    "survival_by_class": "survival_by_class",
+    "survival_by_gender": "gender_distribution",
+    "survival_overall": "survival_count",
+}
+
+# Visualization for queries without a confident intent, most specific first
+VISUALIZATION_RULES = [
+    ({"age", "distribution"}, "age_histogram"),
+    ({"fare", "distribution"}, "fare_histogram"),
+    ({"sex"}, "gender_distribution"),
+    ({"embark"}, "embarkation_count"),
+    ({"class", "survival"}, "survival_by_class"),
+    ({"survival"}, "survival_count"),
+    ({"correlation"}, "correlation_heatmap"),
+    ({"age", "fare"}, "age_vs_fare"),
+]
+
+# Labelled questions for the TF-IDF classifier
+TRAINING_EXAMPLES = [
+    ("What percentage of passengers were male on the Titanic?", "gender_distribution"),
+    ("What percentage of passengers were female?", "gender_distribution"),
+    ("How many men and women were on board?", "gender_distribution"),
+    ("What was the gender breakdown of the passengers?", "gender_distribution"),
+    ("Show the ratio of male to female passengers", "gender_distribution"),
+    ("How many passengers were women?", "gender_distribution"),
+    ("How many women were aboard?", "gender_distribution"),
+    ("How many male passengers were there?", "gender_distribution"),
+    ("Show me a histogram of passenger ages", "age_distribution"),
+    ("What was the age distribution of passengers?", "age_distribution"),
+    ("What was the average age of passengers?", "age_distribution"),
+    ("How old were the passengers on average?", "age_distribution"),
+    ("Plot the distribution of ages", "age_distribution"),
+    ("What was the mean passenger age?", "age_distribution"),
+    ("What was the average age?", "age_distribution"),
+    ("What was the average ticket fare?", "average_fare"),
+    ("How much did passengers pay for a ticket on average?", "average_fare"),
+    ("What was the mean fare?", "average_fare"),
+    ("Show me the distribution of ticket fares", "average_fare"),
+    ("What was the typical ticket price?", "average_fare"),
+    ("Plot a histogram of fares", "average_fare"),
+    ("What was the average fare paid?", "average_fare"),
+    ("How many passengers embarked from each port?", "embarkation"),
+    ("Where did passengers board the ship?", "embarkation"),
+    ("How many passengers boarded at each port?", "embarkation"),
+    ("Which ports did passengers embark from?", "embarkation"),
+    ("Show the number of passengers per embarkation port", "embarkation"),
+    ("What was the survival rate by passenger class?", "survival_by_class"),
+    ("Did passengers in higher classes survive more often?", "survival_by_class"),
+    ("Compare survival across classes", "survival_by_class"),
+    ("How did survival differ between the classes?", "survival_by_class"),
+    ("Survival rate for each pclass", "survival_by_class"),
+    ("Did women have a higher survival rate than men?", "survival_by_gender"),
+    ("What was the survival rate for men and women?", "survival_by_gender"),
+    ("Were females more likely to survive than males?", "survival_by_gender"),
+    ("Compare survival by gender", "survival_by_gender"),
+    ("How many women survived compared with men?", "survival_by_gender"),
+    ("How many passengers survived?", "survival_overall"),
+    ("What was the overall survival rate?", "survival_overall"),
+    ("How many people died on the Titanic?", "survival_overall"),
+    ("What percentage of passengers survived?", "survival_overall"),
+    ("Show the number of survivors", "survival_overall"),
+    ("Who was the oldest passenger?", OTHER),
+    ("List passengers named Smith", OTHER),
+    ("How many children under 10 survived in third class?", OTHER),
+    ("Which passenger paid the highest fare?", OTHER),
+    ("How many passengers had siblings or spouses aboard?", OTHER),
+    ("What was the median age of first class women who survived?", OTHER),
+    ("Which cabin had the most passengers?", OTHER),
+    ("How many passengers travelled alone?", OTHER),
+    ("What was the average fare by class and port?", OTHER),
+    ("Show me the correlation between the numeric features", OTHER),
+    ("Plot age against fare", OTHER),
+    ("Were passengers with cabins more likely to survive?", OTHER),
+    ("What is the youngest survivor's name?", OTHER),
+    ("How many families were on board?", OTHER),
+    ("What percentage of women survived?", OTHER),
+    ("What was the average age of survivors?", OTHER),
+    ("What was the average fare for women?", OTHER),
+    ("What percentage of first class passengers survived?", OTHER),
+    ("How many people survived from Cherbourg?", OTHER),
+    ("How many men were in third class?", OTHER),
+    ("What was the average fare of first class passengers?", OTHER),
+    ("What was the maximum fare?", OTHER),
+    ("What was the total fare paid?", OTHER),
+    ("What was the minimum age?", OTHER),
+    ("How many people embarked at Southampton?", OTHER),
+]
+
+def extract_features(query):
+    """Return the set of keyword features present in a query, in one regex pass"""
+    return {match.lastgroup for match in _KEYWORD_PATTERN.finditer(query.lower())}
+
+def _rule_intents(features):
+    """Intents of the most specific keyword rules satisfied by the features (several on a tie)"""
+    best_size, best = 0, set()
+    for intent, required in INTENT_RULES:
+        if required <= features:
+            if len(required) > best_size:
+                best_size, best = len(required), {intent}
+            elif len(required) == best_size:
+                best.add(intent)
+    return best
+
+def covers_filters(intent, features):
+    """Whether one of the intent's rules matches the query and names every filter feature of it"""
+    filters = features & FILTER_FEATURES
+    return any(
+        rule_intent == intent and required <= features and filters <= required
+        for rule_intent, required in INTENT_RULES
+    )
+
+class RouteDecision:
+    """Outcome of routing one query"""
+
+    def __init__(self, intent, confidence, features, deterministic, covered=False):
+        self.intent = intent
+        self.confidence = confidence
+        self.features = features
+        self.deterministic = deterministic
+        # The intent's answer accounts for every filter in the query
+        self.covered = covered
+
+    @property
+    def visualization_type(self):
+        if self.deterministic:
+            return INTENT_VISUALIZATIONS[self.intent]
+        for required, visualization_type in VISUALIZATION_RULES:
+            if required <= self.features:
+                return visualization_type
+        return None
+
+    def __repr__(self):
+        return f"RouteDecision(intent={self.intent!r}, confidence={self.confidence:.2f}, deterministic={self.deterministic})"
+
+class IntentRouter:
+    """
+    Routes questions to deterministic answers before the LLM.
+
+    Keyword features from one compiled regex pick a candidate intent; a
+    TF-IDF + logistic regression classifier trained on TRAINING_EXAMPLES
+    scores it. Queries whose confidence reaches the threshold are answered
+    from the dataset; everything else goes to the LLM agent.
+    """
+
+    def __init__(self, threshold=0.6, examples=TRAINING_EXAMPLES):
+        self.threshold = threshold
+        self.examples = examples
+        self._model = None
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    @property
+    def trained(self):
+        return self._model is not None
+
+    def warm_up(self):
+        """Train the classifier ahead of the first query (e.g. from a background thread)"""
+        self.model
+
+    @property
+    def model(self):
+        """Classifier, trained on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # scikit-learn is slow to import, so it's loaded with the first query
+                    from sklearn.feature_extraction.text import TfidfVectorizer
+                    from sklearn.linear_model import LogisticRegression
+                    from sklearn.pipeline import make_pipeline
+
+                    questions, labels = zip(*self.examples)
+                    model = make_pipeline(
+                        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+                        LogisticRegression(C=10.0, max_iter=1000),
+                    )
+                    model.fit(questions, labels)
+                    self._model = model
+        return self._model
+
+    def route(self, query):
+        """Classify a query without recording it in the counters"""
+        return self.route_many([query])[0]
+
+    def route_many(self, queries):
+        """Classify several queries with a single vectorized classifier call"""
+        if not queries:
+            return []
+        classes = [str(label) for label in self.model.classes_]
+        decisions = []
+        for query, row in zip(queries, self.model.predict_proba(list(queries))):
+            decisions.append(self._decide(query, dict(zip(classes, row.tolist()))))
+        return decisions
+
+    def _decide(self, query, probabilities):
+        features = extract_features(query)
+        classifier_intent = max(probabilities, key=probabilities.get)
+        rule_intents = _rule_intents(features)
+
+        if len(rule_intents) > 1:
+            # Equally specific rules for different intents, e.g. "percentage of women
+            # who survived" matches {sex, percentage} and {survival, percentage}: the
+            # question is a combination none of the aggregates answers
+            intent = classifier_intent
+            confidence = probabilities[intent]
+            covered = intent in rule_intents and covers_filters(intent, features)
+            return RouteDecision(intent, confidence, features, False, covered)
+        if classifier_intent in rule_intents:
+            # Keyword and classifier evidence agree: halve the remaining uncertainty
+            intent = classifier_intent
+            confidence = 1 - (1 - probabilities[intent]) / 2
+        elif len(rule_intents) == 1:
+            intent = next(iter(rule_intents))
+            confidence = probabilities.get(intent, 0.0)
+        else:
+            intent = classifier_intent
+            confidence = probabilities[intent]
+            if intent != OTHER and not rule_intents:
+                # No keyword supports the classifier's guess
+                confidence /= 2
+        covered = intent != OTHER and covers_filters(intent, features)
+        deterministic = covered and confidence >= self.threshold
+        return RouteDecision(intent, confidence, features, deterministic, covered)
+
+    def record(self, decision):
+        """Count which route a processed query took"""
+        self.counters[decision.intent if decision.deterministic else "llm"] += 1
+
+    def stats(self):
+        return {"threshold": self.threshold, "routes": dict(self.counters)}
+
+intent_router = IntentRouter(threshold=float(os.environ.get("INTENT_CONFIDENCE_THRESHOLD", "0.6")))
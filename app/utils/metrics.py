@@ -0,0 +1,188 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# (stage, seconds) pairs recorded while handling the current request
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', repr(bound))])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+class Counter:
+    """Monotonic counter rendered in the Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Gauge:
+    """Point-in-time value rendered in the Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+REQUEST_SECONDS = Histogram(
+    "titanic_request_seconds", "HTTP request latency in seconds", ("method", "path", "status")
+)
+STAGE_SECONDS = Histogram(
+    "titanic_stage_seconds", "Time spent in each request processing stage in seconds", ("stage",)
+)
+LLM_CALL_SECONDS = Histogram("titanic_llm_call_seconds", "Latency of individual LLM calls in seconds")
+LLM_TOKENS = Counter("titanic_llm_tokens_total", "LLM tokens used", ("type",))
+LLM_CALLS = Counter("titanic_llm_calls_total", "LLM calls made", ("outcome",))
+LLM_CALLS_PER_QUERY = Histogram(
+    "titanic_llm_calls_per_query", "LLM calls made to answer one query", ("mode",), buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15)
+)
+
+LLM_QUEUE_DEPTH = Gauge("titanic_llm_queue_depth", "LLM-bound queries waiting for a slot", ("priority",))
+LLM_IN_FLIGHT = Gauge("titanic_llm_in_flight", "LLM-bound queries being answered")
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "titanic_llm_queue_wait_seconds", "Time LLM-bound queries waited for a slot in seconds", ("priority",)
+)
+LLM_SHED = Counter("titanic_llm_shed_total", "LLM-bound queries answered by the fallback instead", ("reason",))
+
+METRICS = [
+    REQUEST_SECONDS, STAGE_SECONDS, LLM_CALL_SECONDS, LLM_TOKENS, LLM_CALLS, LLM_CALLS_PER_QUERY,
+    LLM_QUEUE_DEPTH, LLM_IN_FLIGHT, LLM_QUEUE_WAIT_SECONDS, LLM_SHED,
+]
+
+def record_stage(stage, seconds):
+    """Record time spent in a stage, both in the histograms and for the current request"""
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+class _StageTimer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.stage, time.perf_counter() - self.started)
+        return False
+
+_NOOP_TIMER = nullcontext()
+
+def timed(stage):
+    """Context manager timing a stage; a shared no-op when metrics are disabled"""
+    if not METRICS_ENABLED:
+        return _NOOP_TIMER
+    return _StageTimer(stage)
+
+def start_request_timings():
+    """Begin collecting stage timings for the current request"""
+    return _request_timings.set([])
+
+def current_request_timings():
+    """(stage, seconds) pairs recorded so far for the current request"""
+    return _request_timings.get() or []
+
+def finish_request_timings(token):
+    """Stop collecting and return the (stage, seconds) pairs for the request"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+def server_timing_header(timings):
+    """Format stage timings as a Server-Timing header, summing repeated stages"""
+    totals, counts = {}, {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+        counts[stage] = counts.get(stage, 0) + 1
+    entries = []
+    for stage, seconds in totals.items():
+        entry = f"{stage};dur={seconds * 1000:.2f}"
+        if counts[stage] > 1:
+            entry += f';desc="{counts[stage]} calls"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
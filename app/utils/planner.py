@@ -0,0 +1,193 @@
+import json
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.data_loader import (
+    load_titanic_dataset, get_dataset_version, get_dataset_summary, is_streaming,
+    TITANIC_COLUMNS, CATEGORICAL_COLUMNS, INTEGER_COLUMNS, FLOAT_COLUMNS, NUMERIC_COLUMNS,
+)
+from app.utils.aggregates import DIMENSIONS
+from app.utils.chart_service import VISUALIZATION_TYPES
+
+# Whether plan mode makes a second LLM call to phrase answers it can't fill in locally
+PLAN_PHRASE_ANSWER = os.environ.get("PLAN_PHRASE_ANSWER", "1") == "1"
+
+# Prompts end with these so that the reply is just the plan / the answer
+PLAN_MARKER = "Plan (JSON):"
+ANSWER_MARKER = "Answer:"
+RESULT_PLACEHOLDER = "{result}"
+
+EXPRESSION_HELP = (
+    "Input is a pandas-style expression on the DataFrame `df`, for example "
+    'query("Sex == \'female\' and Pclass == 1")[\'Survived\'].mean(), '
+    "groupby('Pclass')['Fare'].mean() or sort_values('Age', ascending=False).head(5). "
+    "Supported: query/boolean filters, column selection, groupby, aggregations "
+    "(mean, sum, count, min, max, median, std, nunique, size, value_counts, describe), "
+    "sort_values, head, tail, nlargest, nsmallest and shape."
+)
+
+COLUMN_NOTES = {
+    'Survived': "1 = survived, 0 = died",
+    'Pclass': "ticket class, 1 = first",
+    'SibSp': "siblings/spouses aboard",
+    'Parch': "parents/children aboard",
+    'Embarked': "port, C = Cherbourg, Q = Queenstown, S = Southampton",
+}
+
+class PlanError(ValueError):
+    """Raised when the LLM's reply is not a usable query plan"""
+
+@dataclass
+class QueryPlan:
+    expression: Optional[str]
+    visualization_type: Optional[str]
+    answer: Optional[str]
+
+def _column_dtype(df, column):
+    if df is not None:
+        return str(df[column].dtype)
+    if column in CATEGORICAL_COLUMNS:
+        return "category"
+    if column in INTEGER_COLUMNS:
+        return "int"
+    if column in FLOAT_COLUMNS:
+        return "float"
+    return "string"
+
+def _format_number(value):
+    """
+    Thousands separators and two decimals from 1 up, e.g. 1,234,567.89;
+    four significant digits below that, e.g. 0.7421 or 0.0042, never in
+    scientific notation
+    """
+    if isinstance(value, (float, np.floating)):
+        if abs(value) >= 1:
+            return f"{value:,.2f}"
+        if value == 0 or not np.isfinite(value):
+            return f"{value:.4g}"
+        decimals = 3 - int(np.floor(np.log10(abs(value))))
+        return f"{value:.{decimals}f}".rstrip("0").rstrip(".")
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return f"{value:,}"
+    return str(value)
+
+def build_schema_digest():
+    """
+    A compact description of the dataset for the planning prompt: every
+    column's dtype, its categories or range, and how many values are missing
+    """
+    summary = get_dataset_summary()
+    cube = summary.cube()
+    # Exact ranges need the data; a streamed dataset only has the summary
+    df = None if is_streaming() else load_titanic_dataset()
+
+    lines = [f"`df` has {summary.rows} rows and these columns:"]
+    for column in summary.columns or TITANIC_COLUMNS:
+        details = []
+        if column in DIMENSIONS:
+            values = sorted(value for value in cube.rollup(column) if value is not None)
+            details.append("values " + ", ".join(str(value) for value in values))
+        elif column in NUMERIC_COLUMNS:
+            if df is not None and df[column].notnull().any():
+                details.append(f"range {_format_number(df[column].min())} to {_format_number(df[column].max())}")
+            if summary.mean(column) is not None:
+                details.append(f"mean {_format_number(float(summary.mean(column)))}")
+        elif df is not None and df[column].notnull().any():
+            details.append(f"{df[column].nunique()} distinct, e.g. {df[column].dropna().iloc[0]!r}")
+        if column in COLUMN_NOTES:
+            details.append(COLUMN_NOTES[column])
+        missing = summary.missing_values.get(column, 0)
+        if missing:
+            details.append(f"{missing} missing")
+        lines.append(f"- {column} ({_column_dtype(df, column)}): " + "; ".join(details))
+    return "\n".join(lines)
+
+_digest = None
+_digest_lock = threading.Lock()
+
+def get_schema_digest():
+    """The schema digest of the current dataset version, rebuilt when the dataset changes"""
+    global _digest
+    version = get_dataset_version()
+    with _digest_lock:
+        if _digest is None or _digest[0] != version:
+            _digest = (version, build_schema_digest())
+        return _digest[1]
+
+def plan_prompt(question):
+    """Prompt asking for the whole query plan in one reply"""
+    visualizations = ", ".join(VISUALIZATION_TYPES)
+    return (
+        "You answer questions about the Titanic passenger dataset, a pandas DataFrame `df`.\n\n"
+        f"{get_schema_digest()}\n\n"
+        "Write one expression that computes the answer. "
+        f"{EXPRESSION_HELP}\n\n"
+        "Reply with a single JSON object and nothing else, with these keys:\n"
+        '"expression": the expression, or null if the dataset cannot answer the question;\n'
+        f'"visualization_type": the most relevant chart, one of {visualizations}, or null;\n'
+        f'"answer": a one-sentence answer with {RESULT_PLACEHOLDER} where the computed value goes, '
+        "or null if the answer needs more than one value. When expression is null, the full answer.\n\n"
+        f"Question: {question}\n"
+        f"{PLAN_MARKER}"
+    )
+
+def parse_plan(text):
+    """Parse the LLM's reply to plan_prompt() into a QueryPlan"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise PlanError(f"No JSON object in the plan: {text[:200]!r}")
+    try:
+        payload = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise PlanError(f"Invalid plan JSON: {str(e)}")
+    if not isinstance(payload, dict):
+        raise PlanError("The plan must be a JSON object")
+
+    expression = payload.get("expression")
+    answer = payload.get("answer")
+    if expression is not None and (not isinstance(expression, str) or not expression.strip()):
+        raise PlanError("The plan's expression must be a non-empty string or null")
+    if answer is not None and not isinstance(answer, str):
+        raise PlanError("The plan's answer must be a string or null")
+    if expression is None and not answer:
+        raise PlanError("The plan has neither an expression nor an answer")
+    visualization_type = payload.get("visualization_type")
+    if visualization_type not in VISUALIZATION_TYPES:
+        visualization_type = None
+    return QueryPlan(expression.strip() if expression else None, visualization_type, answer)
+
+def fill_answer(plan, result):
+    """
+    The plan's answer with the computed value filled in, or None when the
+    result is a table or the plan left the wording to the phrasing call
+    """
+    if plan.expression is None:
+        return plan.answer
+    if not plan.answer or RESULT_PLACEHOLDER not in plan.answer:
+        return None
+    if isinstance(result, (pd.DataFrame, pd.Series)) or not np.isscalar(result):
+        return None
+    if isinstance(result, np.generic):
+        result = result.item()
+    if isinstance(result, float) and result.is_integer():
+        result = int(result)
+    return plan.answer.replace(RESULT_PLACEHOLDER, _format_number(result))
+
+def phrase_prompt(question, expression, observation):
+    """Prompt for the optional second call, which turns a computed result into the answer"""
+    return (
+        "You answer questions about the Titanic passenger dataset.\n"
+        f"Question: {question}\n"
+        f"The expression {expression} on the dataset returned:\n{observation}\n\n"
+        "Answer the question in one or two sentences using this result.\n"
+        f"{ANSWER_MARKER}"
+    )
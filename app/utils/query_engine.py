@@ -0,0 +1,432 @@
+import ast
+import functools
+import operator
+import os
+import re
+import sys
+
+import pandas as pd
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.data_loader import TITANIC_COLUMNS, NUMERIC_COLUMNS
+
+MAX_QUERY_LENGTH = 1000
+# Bound on numeric literals, so that arithmetic can't build huge values
+MAX_NUMERIC_LITERAL = 10_000_000
+PLAN_CACHE_SIZE = int(os.environ.get("QUERY_PLAN_CACHE_SIZE", "256"))
+
+# Aggregations usable on frames, series and group-bys
+AGGREGATIONS = {
+    'mean', 'sum', 'count', 'min', 'max', 'median', 'std', 'var', 'nunique', 'size',
+}
+NUMERIC_AGGREGATIONS = {'mean', 'sum', 'median', 'std', 'var', 'min', 'max'}
+
+# Whitelisted methods and the keyword arguments each one accepts
+METHODS = {
+    'groupby': {'by', 'as_index', 'dropna'},
+    'agg': {'func'},
+    'aggregate': {'func'},
+    'sort_values': {'by', 'ascending'},
+    'sort_index': {'ascending'},
+    'head': {'n'},
+    'tail': {'n'},
+    'nlargest': {'n', 'columns'},
+    'nsmallest': {'n', 'columns'},
+    'value_counts': {'normalize', 'dropna', 'ascending', 'sort'},
+    'describe': set(),
+    'unique': set(),
+    'mode': {'dropna'},
+    'idxmax': set(),
+    'idxmin': set(),
+    'corr': set(),
+    'isnull': set(),
+    'isna': set(),
+    'notnull': set(),
+    'notna': set(),
+    'dropna': {'subset'},
+    'round': {'decimals'},
+    'reset_index': {'drop', 'name'},
+}
+METHODS.update({name: {'numeric_only'} for name in AGGREGATIONS})
+
+ATTRIBUTES = {'shape', 'columns', 'dtypes', 'size', 'empty', 'index', 'values'}
+
+COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+}
+STRING_METHODS = {'contains', 'startswith', 'endswith'}
+NULL_CHECKS = {'isnull': False, 'isna': False, 'notnull': True, 'notna': True}
+
+class QueryError(ValueError):
+    """Raised when a query is not part of the supported query language"""
+
+def normalize_query_text(text):
+    """Canonical form of a query used as the plan cache key"""
+    text = text.strip().strip('`').strip().rstrip(';').strip()
+    # Collapse whitespace outside of string literals
+    return re.sub(r"""('[^']*'|"[^"]*")|\s+""", lambda m: m.group(1) or ' ', text)
+
+def _check_column(name):
+    if name not in TITANIC_COLUMNS:
+        raise QueryError(f"Unknown column '{name}'. Available columns: {', '.join(TITANIC_COLUMNS)}")
+    return name
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, SyntaxError, TypeError):
+        raise QueryError(f"Only literal arguments are allowed, got '{ast.unparse(node)}'")
+
+def _check_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and abs(value) > MAX_NUMERIC_LITERAL:
+        raise QueryError("Numeric arguments are out of range")
+
+def _check_arithmetic_operand(node, bare_names):
+    """Arithmetic is only allowed on numbers and numeric columns ('a' * 10**8 would be a huge string)"""
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return
+    elif isinstance(node, (ast.BinOp, ast.UnaryOp)):
+        # Checked when the nested expression is compiled
+        return
+    else:
+        column = _column_ref(node, bare_names)
+        if column is not None and column in NUMERIC_COLUMNS:
+            return
+    raise QueryError(f"Arithmetic is only supported on numbers and numeric columns, got '{ast.unparse(node)}'")
+
+def _column_ref(node, bare_names):
+    """Return the column referenced by node, or None if node is not a column reference"""
+    if bare_names and isinstance(node, ast.Name):
+        return _check_column(node.id)
+    if isinstance(node, ast.Name) and node.id == 'df':
+        return None
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'df':
+        return _check_column(node.attr)
+    if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'df'
+            and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+        return _check_column(node.slice.value)
+    return None
+
+def _compile_expression(node, bare_names):
+    """
+    Compile a filter expression into a function of the DataFrame.
+    With bare_names, plain identifiers refer to columns (query() strings);
+    otherwise columns are written as df['Col'] or df.Col (boolean indexing).
+    """
+    column = _column_ref(node, bare_names)
+    if column is not None:
+        return lambda df: df[column]
+
+    if isinstance(node, ast.Constant):
+        value = node.value
+        _check_number(value)
+        return lambda df: value
+
+    if isinstance(node, (ast.List, ast.Tuple)):
+        values = _literal(node)
+        return lambda df: list(values)
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_expression(node.operand, bare_names)
+        if isinstance(node.op, ast.Not):
+            return lambda df: ~operand(df)
+        if isinstance(node.op, ast.USub):
+            return lambda df: -operand(df)
+
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_expression(value, bare_names) for value in node.values]
+        combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        return lambda df: functools.reduce(combine, (part(df) for part in parts))
+
+    if isinstance(node, ast.BinOp):
+        # `&` and `|` are how pandas spells boolean logic on masks
+        if isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            combine = operator.and_ if isinstance(node.op, ast.BitAnd) else operator.or_
+        elif type(node.op) in ARITHMETIC:
+            combine = ARITHMETIC[type(node.op)]
+            _check_arithmetic_operand(node.left, bare_names)
+            _check_arithmetic_operand(node.right, bare_names)
+        else:
+            raise QueryError(f"Unsupported operator in '{ast.unparse(node)}'")
+        left = _compile_expression(node.left, bare_names)
+        right = _compile_expression(node.right, bare_names)
+        return lambda df: combine(left(df), right(df))
+
+    if isinstance(node, ast.Compare):
+        return _compile_comparison(node, bare_names)
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        return _compile_call(node, bare_names)
+
+    raise QueryError(f"Unsupported expression '{ast.unparse(node)}'")
+
+def _compile_comparison(node, bare_names):
+    checks = []
+    left_node = node.left
+    for op, right_node in zip(node.ops, node.comparators):
+        left = _compile_expression(left_node, bare_names)
+        if isinstance(op, (ast.In, ast.NotIn)):
+            values = _literal(right_node)
+            if not isinstance(values, (list, tuple, set)):
+                raise QueryError("The right-hand side of 'in' must be a list of values")
+            negate = isinstance(op, ast.NotIn)
+            checks.append(lambda df, left=left, values=list(values), negate=negate:
+                          ~left(df).isin(values) if negate else left(df).isin(values))
+        elif type(op) in COMPARISONS:
+            if isinstance(right_node, ast.Constant) and right_node.value is None and isinstance(op, (ast.Eq, ast.NotEq)):
+                wants_null = isinstance(op, ast.Eq)
+                checks.append(lambda df, left=left, wants_null=wants_null:
+                              left(df).isnull() if wants_null else left(df).notnull())
+            else:
+                right = _compile_expression(right_node, bare_names)
+                compare = COMPARISONS[type(op)]
+                checks.append(lambda df, left=left, right=right, compare=compare: compare(left(df), right(df)))
+        else:
+            raise QueryError(f"Unsupported comparison in '{ast.unparse(node)}'")
+        left_node = right_node
+    return lambda df: functools.reduce(operator.and_, (check(df) for check in checks))
+
+def _compile_call(node, bare_names):
+    method = node.func.attr
+    target = node.func.value
+    args = [_literal(arg) for arg in node.args]
+    kwargs = {keyword.arg: _literal(keyword.value) for keyword in node.keywords}
+
+    if method in NULL_CHECKS and not args and not kwargs:
+        operand = _compile_expression(target, bare_names)
+        if NULL_CHECKS[method]:
+            return lambda df: operand(df).notnull()
+        return lambda df: operand(df).isnull()
+
+    if method == 'isin' and len(args) == 1 and isinstance(args[0], (list, tuple, set)):
+        operand = _compile_expression(target, bare_names)
+        values = list(args[0])
+        return lambda df: operand(df).isin(values)
+
+    if method == 'between' and len(args) == 2:
+        operand = _compile_expression(target, bare_names)
+        low, high = args
+        return lambda df: operand(df).between(low, high)
+
+    if (method in STRING_METHODS and isinstance(target, ast.Attribute) and target.attr == 'str'
+            and len(args) == 1 and isinstance(args[0], str)):
+        if set(kwargs) - {'case', 'na'}:
+            raise QueryError(f"Unsupported arguments for str.{method}")
+        operand = _compile_expression(target.value, bare_names)
+        pattern = args[0]
+        if method == 'contains':
+            case = kwargs.get('case', True)
+            return lambda df: operand(df).str.contains(pattern, case=case, regex=False, na=False)
+        return lambda df: getattr(operand(df).str, method)(pattern, na=False)
+
+    raise QueryError(f"Unsupported function call '{ast.unparse(node)}'")
+
+def _compile_filter(expression_text):
+    try:
+        tree = ast.parse(expression_text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise QueryError(f"Invalid filter expression: {e.msg}")
+    return _compile_expression(tree.body, bare_names=True)
+
+def _check_columns_arg(value):
+    columns = [value] if isinstance(value, str) else value
+    if not isinstance(columns, (list, tuple)):
+        raise QueryError("Expected a column name or a list of column names")
+    for column in columns:
+        _check_column(column)
+
+def _check_method(method, args, kwargs):
+    allowed = METHODS.get(method)
+    if allowed is None:
+        raise QueryError(f"Method '{method}' is not allowed. Allowed methods: {', '.join(sorted(METHODS))}")
+    unknown = set(kwargs) - allowed
+    if unknown:
+        raise QueryError(f"Unsupported argument(s) for {method}(): {', '.join(sorted(unknown))}")
+    if method == 'groupby':
+        _check_columns_arg(args[0] if args else kwargs.get('by'))
+    elif method in ('sort_values',):
+        if args or 'by' in kwargs:
+            _check_columns_arg(args[0] if args else kwargs['by'])
+    elif method in ('nlargest', 'nsmallest') and (len(args) > 1 or 'columns' in kwargs):
+        _check_columns_arg(args[1] if len(args) > 1 else kwargs['columns'])
+    elif method == 'dropna' and 'subset' in kwargs:
+        _check_columns_arg(kwargs['subset'])
+    elif method in ('agg', 'aggregate'):
+        func = args[0] if args else kwargs.get('func')
+        funcs = func if isinstance(func, (list, tuple)) else [func]
+        if isinstance(func, dict):
+            _check_columns_arg(list(func))
+            funcs = [f for value in func.values() for f in (value if isinstance(value, (list, tuple)) else [value])]
+        for name in funcs:
+            if name not in AGGREGATIONS:
+                raise QueryError(f"Unsupported aggregation '{name}'. Allowed: {', '.join(sorted(AGGREGATIONS))}")
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, int):
+            _check_number(value)
+
+class QueryPlan:
+    """A validated sequence of steps that runs as vectorized pandas operations"""
+
+    def __init__(self, text, steps):
+        self.text = text
+        self.steps = steps
+
+    def execute(self, df):
+        result = df
+        for step in self.steps:
+            kind = step[0]
+            if kind == 'filter':
+                result = result[step[1](result)]
+            elif kind == 'select':
+                result = result[step[1]]
+            elif kind == 'attribute':
+                result = getattr(result, step[1])
+            elif kind == 'index':
+                result = result[step[1]]
+            elif kind == 'slice':
+                result = result.iloc[step[1]:step[2]]
+            elif kind == 'method':
+                _, method, args, kwargs = step
+                if (method in NUMERIC_AGGREGATIONS or method == 'corr') and isinstance(result, pd.DataFrame):
+                    kwargs = {'numeric_only': True, **kwargs}
+                elif method == 'groupby':
+                    # Categorical keys would otherwise produce rows for unobserved categories
+                    kwargs = {'observed': True, **kwargs}
+                result = getattr(result, method)(*args, **kwargs)
+        return result
+
+    def __repr__(self):
+        return f"QueryPlan({self.text!r}, steps={[step[0] if step[0] != 'method' else step[1] for step in self.steps]})"
+
+def _parse_chain(node):
+    """Turn a method chain rooted at `df` into a list of plan steps"""
+    if isinstance(node, ast.Name):
+        if node.id != 'df':
+            raise QueryError(f"Unknown name '{node.id}'")
+        return []
+
+    if isinstance(node, ast.Attribute):
+        steps = _parse_chain(node.value)
+        if node.attr in TITANIC_COLUMNS:
+            return steps + [('select', node.attr)]
+        if node.attr in ATTRIBUTES:
+            return steps + [('attribute', node.attr)]
+        raise QueryError(f"Unsupported attribute '{node.attr}'")
+
+    if isinstance(node, ast.Subscript):
+        # df.loc[mask] / df.loc[mask, columns]
+        if isinstance(node.value, ast.Attribute) and node.value.attr == 'loc':
+            steps = _parse_chain(node.value.value)
+            index = node.slice
+            columns = None
+            if isinstance(index, ast.Tuple) and len(index.elts) == 2:
+                index, columns = index.elts
+            if not (isinstance(index, ast.Slice) and index.lower is index.upper is index.step is None):
+                steps.append(('filter', _compile_expression(index, bare_names=False)))
+            if columns is not None:
+                selection = _literal(columns)
+                _check_columns_arg(selection)
+                steps.append(('select', selection))
+            return steps
+
+        # df.iloc[start:stop]
+        if isinstance(node.value, ast.Attribute) and node.value.attr == 'iloc':
+            steps = _parse_chain(node.value.value)
+            if not isinstance(node.slice, ast.Slice) or node.slice.step is not None:
+                raise QueryError("iloc only supports row slices such as iloc[:10]")
+            start = _literal(node.slice.lower) if node.slice.lower else None
+            stop = _literal(node.slice.upper) if node.slice.upper else None
+            return steps + [('slice', start, stop)]
+
+        steps = _parse_chain(node.value)
+        index = node.slice
+        if isinstance(index, ast.Constant) and isinstance(index.value, str):
+            return steps + [('select', _check_column(index.value))]
+        if isinstance(index, ast.Constant) and isinstance(index.value, int):
+            return steps + [('index', index.value)]
+        if isinstance(index, ast.List):
+            selection = _literal(index)
+            _check_columns_arg(selection)
+            return steps + [('select', selection)]
+        return steps + [('filter', _compile_expression(index, bare_names=False))]
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        steps = _parse_chain(node.func.value)
+        method = node.func.attr
+        args = tuple(_literal(arg) for arg in node.args)
+        kwargs = {keyword.arg: _literal(keyword.value) for keyword in node.keywords}
+        if method == 'query':
+            if len(args) != 1 or not isinstance(args[0], str) or kwargs:
+                raise QueryError("query() takes a single filter expression string")
+            return steps + [('filter', _compile_filter(args[0]))]
+        _check_method(method, args, kwargs)
+        return steps + [('method', method, args, kwargs)]
+
+    raise QueryError(f"Unsupported query syntax '{ast.unparse(node)}'")
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compile_normalized(text):
+    if not text:
+        raise QueryError("Empty query")
+    if len(text) > MAX_QUERY_LENGTH:
+        raise QueryError(f"Query is longer than {MAX_QUERY_LENGTH} characters")
+    # Queries are written relative to the DataFrame, e.g. "groupby('Sex')['Survived'].mean()"
+    if not re.match(r"df\s*[.\[]", text):
+        text = "df" + text if text.startswith('[') else "df." + text
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError as e:
+        raise QueryError(f"Invalid query syntax: {e.msg}")
+    return QueryPlan(text, _parse_chain(tree.body))
+
+def compile_query(text):
+    """
+    Parse and validate a query into a QueryPlan.
+    Plans are cached by normalized query text, so repeated tool calls are nearly free.
+    """
+    return _compile_normalized(normalize_query_text(text))
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compile_filter_normalized(text):
+    if not text:
+        raise QueryError("Empty filter")
+    if len(text) > MAX_QUERY_LENGTH:
+        raise QueryError(f"Filter is longer than {MAX_QUERY_LENGTH} characters")
+    return _compile_filter(text)
+
+def compile_filter(text):
+    """
+    Compile a boolean filter such as "Sex == 'female' and Age < 10" (the
+    syntax accepted by query()) into a function returning a row mask
+    """
+    return _compile_filter_normalized(normalize_query_text(text))
+
+def run_query(text, df):
+    """Compile (or fetch from cache) and execute a query against df"""
+    return compile_query(text).execute(df)
+
+def get_plan_cache_stats():
+    info = _compile_normalized.cache_info()
+    total = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / total if total else 0.0,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
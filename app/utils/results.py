@@ -0,0 +1,174 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional; JSON always works
+    pa = None
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Tool output budget for the LLM prompt (roughly 4 characters per token)
+TOOL_OUTPUT_MAX_CHARS = int(os.environ.get("TOOL_OUTPUT_MAX_CHARS", "2000"))
+SUMMARY_EDGE_ROWS = 5
+MAX_COLUMN_WIDTH = 30
+
+# Results produced by tool calls while answering the current query
+_collected_results = contextvars.ContextVar("collected_results", default=None)
+
+def _as_frame(result):
+    """Tabular view of a DataFrame or Series result"""
+    if isinstance(result, pd.Series):
+        return result.reset_index() if not isinstance(result.index, pd.RangeIndex) else result.to_frame()
+    return result
+
+def _to_text(result):
+    if isinstance(result, pd.Series):
+        return result.to_string()
+    return result.to_string(max_colwidth=MAX_COLUMN_WIDTH)
+
+def _column_summary(series):
+    nulls = int(series.isnull().sum())
+    if pd.api.types.is_bool_dtype(series.dtype) or not pd.api.types.is_numeric_dtype(series.dtype):
+        top = series.value_counts().head(3)
+        values = ", ".join(f"{str(value)[:MAX_COLUMN_WIDTH]} ({count})" for value, count in top.items())
+        summary = f"{series.nunique()} distinct, top: {values}"
+    else:
+        summary = f"min {series.min():.4g}, mean {series.mean():.4g}, max {series.max():.4g}"
+    return f"{series.name}: {summary}" + (f", {nulls} missing" if nulls else "")
+
+def shape_for_llm(result, max_chars=TOOL_OUTPUT_MAX_CHARS):
+    """
+    Render a tool result as text for the LLM within max_chars. Results that
+    don't fit are summarized: their size, the first and last rows and a
+    one-line summary per column.
+    """
+    if not isinstance(result, (pd.DataFrame, pd.Series)):
+        text = str(result)
+        return text if len(text) <= max_chars else text[:max_chars - 15] + " ... (truncated)"
+
+    text = _to_text(result)
+    if len(text) <= max_chars:
+        return text
+
+    frame = _as_frame(result)
+    rows, columns = frame.shape
+    parts = [f"{rows} rows x {columns} columns (showing a summary; the full result is returned to the user)"]
+    for edge_rows in range(SUMMARY_EDGE_ROWS, 0, -1):
+        head = _to_text(frame.head(edge_rows))
+        tail = _to_text(frame.tail(edge_rows))
+        sample = f"First {edge_rows} rows:\n{head}" + (f"\nLast {edge_rows} rows:\n{tail}" if rows > edge_rows * 2 else "")
+        if len(parts[0]) + len(sample) <= max_chars // 2 or edge_rows == 1:
+            break
+    parts.append(sample)
+    parts.append("Columns:\n" + "\n".join(_column_summary(frame[column]) for column in frame.columns))
+    text = "\n".join(parts)
+    return text if len(text) <= max_chars else text[:max_chars - 15] + " ... (truncated)"
+
+class ResultStore:
+    """
+    Full tool results kept for the API client, which pages through them
+    while the LLM only saw a summary. Entries live in a size-bounded LRU and
+    expire after ttl seconds.
+    """
+
+    def __init__(self, ttl=3600, max_size=256):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, query, result):
+        """Store a DataFrame or Series result and return its descriptor"""
+        frame = _as_frame(result)
+        info = {
+            "id": uuid.uuid4().hex,
+            "query": query,
+            "rows": len(frame),
+            "columns": [str(column) for column in frame.columns],
+        }
+        with self._lock:
+            self._entries[info["id"]] = (frame, info, time.time())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return info
+
+    def get(self, result_id):
+        """Return (frame, descriptor) or None when unknown or expired"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None:
+                return None
+            frame, info, created = entry
+            if time.time() - created > self.ttl:
+                del self._entries[result_id]
+                return None
+            self._entries.move_to_end(result_id)
+            return frame, info
+
+    def stats(self):
+        return {"size": len(self._entries), "max_size": self.max_size, "ttl": self.ttl}
+
+def columnar_json(frame, offset, limit, total):
+    """
+    A page of a result as {"columns", "dtypes", "data": {column: [values]}}.
+    Each column is encoded by pandas' C JSON encoder rather than row by row in Python.
+    """
+    columns = [str(column) for column in frame.columns]
+    header = json.dumps({
+        "offset": offset,
+        "limit": limit,
+        "total": total,
+        "columns": columns,
+        "dtypes": [str(dtype) for dtype in frame.dtypes],
+    })
+    data = ",".join(
+        f"{json.dumps(name)}:{frame.iloc[:, i].to_json(orient='values', date_format='iso')}"
+        for i, name in enumerate(columns)
+    )
+    return f'{header[:-1]}, "data": {{{data}}}}}'
+
+def arrow_ipc(frame):
+    """A page of a result as an Arrow IPC stream"""
+    if pa is None:
+        raise RuntimeError("Arrow output requires pyarrow")
+    frame = frame.copy(deep=False)
+    frame.columns = [str(column) for column in frame.columns]
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+@contextmanager
+def collect_results():
+    """Collect the descriptors of results stored while answering one query"""
+    collected = []
+    token = _collected_results.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected_results.reset(token)
+
+def record_result(query, result):
+    """Store a full tool result and attach it to the query being answered, if any"""
+    info = result_store.put(query, result)
+    collected = _collected_results.get()
+    if collected is not None:
+        collected.append(info)
+    return info
+
+result_store = ResultStore(
+    ttl=float(os.environ.get("RESULT_STORE_TTL", "3600")),
+    max_size=int(os.environ.get("RESULT_STORE_MAX_SIZE", "256")),
+)
@@ -0,0 +1,298 @@
+import asyncio
+import heapq
+import itertools
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.metrics import LLM_QUEUE_DEPTH, LLM_IN_FLIGHT, LLM_QUEUE_WAIT_SECONDS, LLM_SHED, record_stage
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+# Token buckets are pruned once there are this many; idle full buckets carry no state
+MAX_BUCKETS = 1024
+
+class SchedulerRejected(Exception):
+    """Raised when a query is shed instead of being queued for the LLM"""
+
+    def __init__(self, reason):
+        super().__init__(f"Query shed: {reason}")
+        self.reason = reason
+
+class TokenBucket:
+    """Allows `rate` admissions per second on average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class _Waiter:
+    __slots__ = ("priority", "deadline", "seq", "key", "future")
+
+    def __init__(self, priority, deadline, seq, key, future):
+        self.priority = priority
+        self.deadline = deadline
+        self.seq = seq
+        self.key = key
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.priority, self.deadline, self.seq) < (other.priority, other.deadline, other.seq)
+
+class QueryScheduler:
+    """
+    Admission control for LLM-bound queries.
+
+    Queries wait in a bounded priority queue (interactive before batch, then
+    earliest deadline first) for one of max_concurrency slots. Queries made
+    with a caller's own API key are also held to per_key_concurrency slots and
+    a token bucket refilling at rate_per_minute, so one busy key can't starve
+    the others; queries without a key (key=None) share the server's key and
+    only the global limit. None or 0 disables a per-key limit.
+
+    A query is shed with SchedulerRejected, for the caller to answer some
+    cheaper way, when the queue is full or when its estimated or actual wait
+    would pass its deadline (default_deadline=None waits without one).
+    Used from the event loop only; it is not thread-safe.
+    """
+
+    def __init__(self, max_concurrency=8, per_key_concurrency=4, rate_per_minute=60, burst=10,
+                 max_queue=100, default_deadline=30.0):
+        self.max_concurrency = max_concurrency
+        self.per_key_concurrency = per_key_concurrency
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_queue = max_queue
+        self.default_deadline = default_deadline
+        self._queue = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._key_in_flight = {}
+        self._buckets = {}
+        self._timer = None
+        self._timer_at = None
+        # Moving average of how long a query holds its slot, for wait estimates
+        self._service_seconds = None
+        self.admitted = 0
+        self.shed = {}
+        self.wait_seconds = 0.0
+
+    def _key_wait(self, key, now):
+        """Seconds until the key's token bucket allows another query"""
+        if key is None or not self.rate_per_minute:
+            return 0.0
+        return self._bucket(key, now).wait_time(now)
+
+    def _key_saturated(self, key):
+        if key is None or not self.per_key_concurrency:
+            return False
+        return self._key_in_flight.get(key, 0) >= self.per_key_concurrency
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._buckets = {
+                    other: kept for other, kept in self._buckets.items()
+                    if other in self._key_in_flight or not kept.is_full(now)
+                }
+            bucket = self._buckets[key] = TokenBucket(self.rate_per_minute / 60, self.burst, now)
+        return bucket
+
+    def estimated_wait(self, key, priority, now=None):
+        """Seconds a new query would likely wait for a slot, judging by the queries ahead of it"""
+        now = time.monotonic() if now is None else now
+        wait = 0.0
+        if self._service_seconds is not None:
+            ahead = sum(1 for waiter in self._queue if waiter.priority <= priority and not waiter.future.done())
+            excess = ahead + self._in_flight + 1 - self.max_concurrency
+            if excess > 0:
+                wait = excess / self.max_concurrency * self._service_seconds
+        return max(wait, self._key_wait(key, now))
+
+    def _reject(self, reason):
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        LLM_SHED.inc(reason=reason)
+        raise SchedulerRejected(reason)
+
+    async def acquire(self, key=None, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """
+        Wait for a slot. `key` identifies a caller-supplied API key (None for
+        the server's own). `deadline` is a time.monotonic() timestamp; without
+        one the query may wait default_deadline seconds. Raises
+        SchedulerRejected when the query is shed. Every successful acquire
+        must be released
+        """
+        now = time.monotonic()
+        if deadline is None:
+            deadline = float("inf") if self.default_deadline is None else now + self.default_deadline
+        if self._queued >= self.max_queue:
+            self._reject("queue_full")
+        if now + self.estimated_wait(key, priority, now) > deadline:
+            self._reject("deadline")
+
+        waiter = _Waiter(priority, deadline, next(self._seq), key, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        self._queued += 1
+        self._dispatch()
+        try:
+            timeout = None if deadline == float("inf") else max(deadline - now, 0)
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._abandon(waiter)
+                self._reject("deadline")
+        except asyncio.CancelledError:
+            # The client went away; give up the queue entry, or the slot if it was just granted
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(key)
+            else:
+                self._abandon(waiter)
+            raise
+
+        waited = time.monotonic() - now
+        self.admitted += 1
+        self.wait_seconds += waited
+        LLM_QUEUE_WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES.get(priority, priority))
+        record_stage("queue", waited)
+
+    def release(self, key=None, held_seconds=None):
+        """Give back a slot, noting how long it was held"""
+        self._in_flight -= 1
+        if key is not None:
+            remaining = self._key_in_flight.get(key, 0) - 1
+            if remaining > 0:
+                self._key_in_flight[key] = remaining
+            else:
+                self._key_in_flight.pop(key, None)
+        if held_seconds is not None:
+            if self._service_seconds is None:
+                self._service_seconds = held_seconds
+            else:
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * held_seconds
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, key=None, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """Hold a slot for the body of the block; see acquire()"""
+        await self.acquire(key, priority, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(key, time.monotonic() - started)
+
+    def _abandon(self, waiter):
+        # Left in the heap and skipped by _dispatch
+        waiter.future.cancel()
+        self._queued -= 1
+        self._update_gauges()
+
+    def _dispatch(self):
+        """Admit queued queries in priority order while slots, per-key limits and tokens allow"""
+        now = time.monotonic()
+        blocked = []
+        retry_after = None
+        while self._queue and self._in_flight < self.max_concurrency:
+            waiter = heapq.heappop(self._queue)
+            if waiter.future.done():
+                continue
+            if self._key_saturated(waiter.key):
+                # Freed by that key's own release, which dispatches again
+                blocked.append(waiter)
+                continue
+            wait = self._key_wait(waiter.key, now)
+            if wait > 0:
+                blocked.append(waiter)
+                retry_after = wait if retry_after is None else min(retry_after, wait)
+                continue
+            if waiter.key is not None:
+                if self.rate_per_minute:
+                    self._bucket(waiter.key, now).take(now)
+                self._key_in_flight[waiter.key] = self._key_in_flight.get(waiter.key, 0) + 1
+            self._queued -= 1
+            self._in_flight += 1
+            waiter.future.set_result(None)
+        for waiter in blocked:
+            heapq.heappush(self._queue, waiter)
+        if retry_after is not None:
+            self._schedule_dispatch(now + retry_after)
+        self._update_gauges()
+
+    def _schedule_dispatch(self, at):
+        """Dispatch again when the next token is due"""
+        if self._timer is not None and self._timer_at <= at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = asyncio.get_running_loop().call_later(max(at - time.monotonic(), 0), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._timer_at = None
+        self._dispatch()
+
+    def _update_gauges(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for waiter in self._queue:
+            if not waiter.future.done():
+                name = PRIORITY_NAMES.get(waiter.priority, waiter.priority)
+                depth[name] = depth.get(name, 0) + 1
+        for name, count in depth.items():
+            LLM_QUEUE_DEPTH.set(count, priority=name)
+        LLM_IN_FLIGHT.set(self._in_flight)
+
+    def stats(self):
+        return {
+            "queued": self._queued,
+            "in_flight": self._in_flight,
+            "active_keys": len(self._key_in_flight),
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "mean_wait_ms": self.wait_seconds / self.admitted * 1000 if self.admitted else 0.0,
+            "service_seconds_estimate": self._service_seconds,
+            "max_concurrency": self.max_concurrency,
+            "per_key_concurrency": self.per_key_concurrency,
+            "rate_per_minute": self.rate_per_minute,
+            "burst": self.burst,
+            "max_queue": self.max_queue,
+        }
+
+query_scheduler = QueryScheduler(
+    max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "8")),
+    per_key_concurrency=int(os.environ.get("LLM_KEY_MAX_CONCURRENCY", "4")),
+    rate_per_minute=float(os.environ.get("LLM_KEY_RATE_PER_MINUTE", "60")),
+    burst=int(os.environ.get("LLM_KEY_BURST", "10")),
+    max_queue=int(os.environ.get("LLM_QUEUE_MAX", "100")),
+    default_deadline=float(os.environ.get("QUERY_DEADLINE_SECONDS", "30")) or None,
+)
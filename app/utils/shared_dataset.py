@@ -0,0 +1,189 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishers are not serialized across processes
+    fcntl = None
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+# Add parent directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+SEGMENT_PREFIX = os.environ.get("DATASET_SHM_PREFIX", "titanic")
+SEGMENT_VERSION_KEY = b"titanic.version"
+SOURCE_SIGNATURE_KEY = b"titanic.source_signature"
+CATEGORIES_KEY = b"titanic.categories"
+
+def _segment_table(df):
+    """
+    Arrow table for a segment whose columns all map without copying. Arrow
+    nulls need a validity bitmap that pandas converts into a private copy,
+    so float columns keep NaN for missing values and categorical columns are
+    stored as their plain integer codes (-1 for missing), with the categories
+    in the schema metadata
+    """
+    columns, categories = {}, {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            columns[column] = pa.array(series.cat.codes.to_numpy())
+            categories[column] = series.cat.categories.tolist()
+        elif pd.api.types.is_float_dtype(series.dtype):
+            columns[column] = pa.array(series.to_numpy(), from_pandas=False)
+        else:
+            columns[column] = pa.Array.from_pandas(series)
+    table = pa.table(columns)
+    return table.replace_schema_metadata({CATEGORIES_KEY: json.dumps(categories).encode()})
+
+def _segment_frame(table):
+    """DataFrame of a mapped segment table, wrapping the mapped buffers"""
+    metadata = table.schema.metadata or {}
+    categories = json.loads(metadata.get(CATEGORIES_KEY, b"{}"))
+    # split_blocks keeps numeric columns backed by the shared pages
+    df = table.to_pandas(split_blocks=True)
+    for column, values in categories.items():
+        codes = pd.Categorical.from_codes(df[column].to_numpy(), dtype=pd.CategoricalDtype(values), validate=False)
+        # Without copy=False the Series would copy the codes
+        df[column] = pd.Series(codes, index=df.index, copy=False)
+    return df
+
+def default_segment_dir():
+    """/dev/shm when available (RAM-backed on Linux), else the temp directory"""
+    configured = os.environ.get("DATASET_SHM_DIR")
+    if configured:
+        return configured
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+class SharedSegment:
+    """An attached dataset segment: the DataFrame plus the stamps it was published with"""
+
+    def __init__(self, name, version, source_signature, df):
+        self.name = name
+        self.version = version
+        self.source_signature = source_signature
+        self.df = df
+
+class SharedDatasetStore:
+    """
+    Publishes the dataset as an Arrow IPC file in shared memory so that every
+    worker process maps the same pages instead of holding a private copy.
+
+    Each publish writes a new, immutable segment and then atomically replaces
+    a small pointer file naming it. Readers that already mapped the previous
+    segment keep reading it until they let go (unlinking a mapped file does
+    not invalidate the mapping), so a reload never tears an in-flight read.
+    """
+
+    def __init__(self, directory=None, prefix=SEGMENT_PREFIX):
+        if pa is None:
+            raise RuntimeError("The shared-memory dataset requires pyarrow")
+        self.directory = directory or default_segment_dir()
+        self.prefix = prefix
+        self.pointer_path = os.path.join(self.directory, f"{prefix}.current")
+        self.lock_path = os.path.join(self.directory, f"{prefix}.lock")
+
+    def pointer_signature(self):
+        """Changes whenever a new segment is published; None before the first publish"""
+        try:
+            stat = os.stat(self.pointer_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def current_segment_name(self):
+        try:
+            with open(self.pointer_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, df, version, source_signature=b""):
+        """Write df to a new segment and point readers at it; returns the segment name"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.prefix}-{version}-{time.time_ns():x}.arrow"
+        segment_path = os.path.join(self.directory, name)
+        table = _segment_table(df)
+        metadata = dict(table.schema.metadata or {})
+        metadata[SEGMENT_VERSION_KEY] = str(version).encode()
+        metadata[SOURCE_SIGNATURE_KEY] = source_signature
+        # Uncompressed so that readers can map the columns without decoding
+        feather.write_feather(table.replace_schema_metadata(metadata), segment_path, compression='uncompressed')
+
+        tmp_pointer = f"{self.pointer_path}.{os.getpid()}.tmp"
+        with open(tmp_pointer, "w") as f:
+            f.write(name)
+        os.replace(tmp_pointer, self.pointer_path)
+        self._remove_old_segments(keep=name)
+        return name
+
+    def _remove_old_segments(self, keep):
+        for entry in os.listdir(self.directory):
+            if entry.startswith(f"{self.prefix}-") and entry.endswith(".arrow") and entry != keep:
+                try:
+                    os.remove(os.path.join(self.directory, entry))
+                except OSError:
+                    # Still mapped on platforms that forbid unlinking open files; retried next publish
+                    pass
+
+    def attach(self):
+        """Map the current segment zero-copy; returns None when nothing is published"""
+        name = self.current_segment_name()
+        if name is None:
+            return None
+        try:
+            source = pa.memory_map(os.path.join(self.directory, name), 'r')
+        except FileNotFoundError:
+            # Replaced between reading the pointer and opening the segment
+            return None
+        reader = pa.ipc.open_file(source)
+        metadata = reader.schema.metadata or {}
+        df = _segment_frame(reader.read_all())
+        return SharedSegment(
+            name,
+            metadata.get(SEGMENT_VERSION_KEY, b"").decode() or None,
+            metadata.get(SOURCE_SIGNATURE_KEY, b""),
+            df,
+        )
+
+    def publish_lock(self):
+        """Context manager serializing publishers across processes"""
+        return FileLock(self.lock_path)
+
+class FileLock:
+    """Exclusive advisory lock on a file, held across processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        return False
+
+if __name__ == "__main__":
+    # Loader process: publish the dataset before starting the API workers
+    from app.utils.data_loader import publish_shared_dataset
+
+    print(f"Published shared dataset segment {publish_shared_dataset()}")
@@ -1,6 +1,4 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
 import io
@@ -11,10 +9,17 @@ import os
 # Add parent directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from app.utils.data_loader import load_titanic_dataset
+from app.utils.data_loader import load_titanic_dataset, get_dataset_summary, is_streaming, HISTOGRAM_EDGES
+from app.utils.aggregates import get_aggregate_cube
+
+# Scatter plots with more points than this are binned (or sampled) on the server
+SCATTER_MAX_POINTS = int(os.environ.get("CHART_SCATTER_MAX_POINTS", "5000"))
+SCATTER_LARGE_MODE = os.environ.get("CHART_SCATTER_MODE", "density")
 
 def get_base64_encoded_figure(fig):
     """Convert matplotlib figure to base64 encoded string for displaying in Streamlit"""
+    import matplotlib.pyplot as plt
+
     buf = io.BytesIO()
     fig.savefig(buf, format='png', bbox_inches='tight')
     buf.seek(0)
@@ -22,45 +27,77 @@ def get_base64_encoded_figure(fig):
     plt.close(fig)
     return img_str
 
+def _bin_labels(edges):
+    """Range label of each bin; the summary clips values into the last bin, so it is open-ended"""
+    labels = [f"{low:g}-{high:g}" for low, high in zip(edges[:-2], edges[1:-1])]
+    return labels + [f"{edges[-2]:g}+"]
+
+def _binned_histogram(counts, edges, title, xaxis_title):
+    """Bar chart of precomputed histogram counts"""
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=edges[1:] - edges[:-1],
+        customdata=_bin_labels(edges),
+        hovertemplate='%{customdata}: %{y}<extra></extra>',
+    ))
+    fig.update_layout(
+        title=title,
+        xaxis_title=f"{xaxis_title} (last bin: {edges[-2]:g}+)",
+        yaxis_title='Count',
+        bargap=0,
+    )
+    return fig
+
 def plot_survival_count():
     """Plot count of survived vs perished passengers"""
-    df = load_titanic_dataset()
-    fig = plt.figure(figsize=(10, 6))
-    sns.countplot(x='Survived', data=df, palette='viridis')
-    plt.title('Survival Count (0 = No, 1 = Yes)')
-    plt.xlabel('Survived')
-    plt.ylabel('Count')
+    totals = get_aggregate_cube().total()
+    survived = int(totals['Survived_sum'])
+    counts = pd.DataFrame({'Survived': ['0', '1'], 'Count': [totals['Survived_count'] - survived, survived]})
+    fig = px.bar(
+        counts,
+        x='Survived',
+        y='Count',
+        color='Survived',
+        color_discrete_sequence=px.colors.sequential.Viridis[::6],
+        title='Survival Count (0 = No, 1 = Yes)'
+    )
+    fig.update_layout(showlegend=False)
     return fig
 
 def plot_gender_distribution():
     """Plot gender distribution of passengers"""
-    df = load_titanic_dataset()
-    fig = px.pie(df, names='Sex', title='Gender Distribution')
+    by_sex = get_aggregate_cube().rollup('Sex')
+    counts = pd.DataFrame(
+        [{'Sex': sex, 'Count': stats['count']} for sex, stats in sorted(by_sex.items()) if sex is not None]
+    )
+    fig = px.pie(counts, names='Sex', values='Count', title='Gender Distribution')
     return fig
 
 def plot_age_histogram():
     """Plot histogram of passenger ages"""
-    df = load_titanic_dataset()
-    fig = px.histogram(df, x='Age', nbins=20, title='Distribution of Passenger Ages')
-    fig.update_layout(xaxis_title='Age', yaxis_title='Count')
-    return fig
+    # Binned from the running summary, which is updated incrementally on ingest
+    counts, edges = get_dataset_summary().histogram('Age')
+    return _binned_histogram(counts, edges, 'Distribution of Passenger Ages', 'Age')
 
 def plot_fare_histogram():
     """Plot histogram of ticket fares"""
-    df = load_titanic_dataset()
-    fig = px.histogram(df, x='Fare', nbins=30, title='Distribution of Ticket Fares')
-    fig.update_layout(xaxis_title='Fare', yaxis_title='Count')
-    return fig
+    # Binned from the running summary, which is updated incrementally on ingest
+    counts, edges = get_dataset_summary().histogram('Fare')
+    return _binned_histogram(counts, edges, 'Distribution of Ticket Fares', 'Fare')
 
 def plot_embarkation_count():
     """Plot count of passengers by embarkation port"""
-    df = load_titanic_dataset()
+    by_port = get_aggregate_cube().rollup('Embarked')
     # Replace port codes with more readable names
     port_names = {'C': 'Cherbourg', 'Q': 'Queenstown', 'S': 'Southampton'}
-    df['Embarkation Port'] = df['Embarked'].map(port_names)
+    counts = pd.DataFrame(
+        [{'Embarkation Port': port_names.get(port, port), 'Count': stats['count']}
+         for port, stats in by_port.items() if port is not None]
+    ).sort_values('Embarkation Port')
     
     fig = px.bar(
-        df.groupby('Embarkation Port').size().reset_index(name='Count'), 
+        counts, 
         x='Embarkation Port', 
         y='Count',
         title='Passengers by Embarkation Port'
@@ -69,8 +106,10 @@ def plot_embarkation_count():
 
 def plot_survival_by_class():
     """Plot survival rate by passenger class"""
-    df = load_titanic_dataset()
-    survival_by_class = df.groupby('Pclass')['Survived'].mean().reset_index()
+    by_class = get_aggregate_cube().rollup('Pclass')
+    survival_by_class = pd.DataFrame(
+        [{'Pclass': pclass, 'Survived': stats['Survived_mean']} for pclass, stats in sorted(by_class.items())]
+    )
     survival_by_class['Survival Rate'] = survival_by_class['Survived'] * 100
     
     fig = px.bar(
@@ -82,27 +121,58 @@ def plot_survival_by_class():
     )
     return fig
 
+def _age_fare_density(summary):
+    """Heatmap of the 2D-binned age/fare counts; its size doesn't depend on the row count"""
+    age_edges, fare_edges = HISTOGRAM_EDGES['Age'], HISTOGRAM_EDGES['Fare']
+    age_labels, fare_labels = _bin_labels(age_edges), _bin_labels(fare_edges)
+    fig = go.Figure(go.Heatmap(
+        x=(age_edges[:-1] + age_edges[1:]) / 2,
+        y=(fare_edges[:-1] + fare_edges[1:]) / 2,
+        z=summary.histogram2d.T,
+        customdata=[[(age, fare) for age in age_labels] for fare in fare_labels],
+        hovertemplate='Age %{customdata[0]}, Fare %{customdata[1]}: %{z}<extra></extra>',
+        colorscale='Viridis',
+        colorbar={'title': 'Passengers'},
+    ))
+    fig.update_layout(
+        title='Age vs Fare (passenger density)',
+        xaxis_title=f"Age (last bin: {age_labels[-1]})",
+        yaxis_title=f"Fare (last bin: {fare_labels[-1]})",
+    )
+    return fig
+
 def plot_age_vs_fare():
-    """Create a scatter plot of age vs fare with survival indicated by color"""
-    df = load_titanic_dataset()
+    """
+    Create a scatter plot of age vs fare with survival indicated by color.
+    Above SCATTER_MAX_POINTS points it shows their binned density instead, or
+    a sample stratified by survival when SCATTER_LARGE_MODE is "sample"
+    """
+    summary = get_dataset_summary()
+    points = int(summary.histogram2d.sum())
+    if is_streaming() or (points > SCATTER_MAX_POINTS and SCATTER_LARGE_MODE != "sample"):
+        return _age_fare_density(summary)
+    
+    df = load_titanic_dataset().dropna(subset=['Age', 'Fare'])
+    title = 'Age vs Fare (colored by survival)'
+    if len(df) > SCATTER_MAX_POINTS:
+        # Sampling each survival group at the same rate keeps their proportions
+        df = df.groupby('Survived', group_keys=False).sample(frac=SCATTER_MAX_POINTS / len(df), random_state=0)
+        title = f'Age vs Fare (colored by survival, {len(df):,} of {points:,} passengers sampled)'
     fig = px.scatter(
-        df.dropna(subset=['Age', 'Fare']), 
+        df, 
         x='Age', 
         y='Fare', 
         color='Survived',
         opacity=0.7,
         color_discrete_map={0: 'red', 1: 'green'},
-        title='Age vs Fare (colored by survival)'
+        title=title
     )
     return fig
 
 def plot_correlation_heatmap():
     """Create a correlation heatmap of numeric features"""
-    df = load_titanic_dataset()
-    numeric_df = df.select_dtypes(include=['float64', 'int64'])
-    
     fig = px.imshow(
-        numeric_df.corr(),
+        get_dataset_summary().correlation(),
         text_auto=True,
         aspect="auto",
         title="Correlation Heatmap"
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain.llms.base import LLM
+
+from app.utils.planner import PLAN_MARKER, ANSWER_MARKER, RESULT_PLACEHOLDER
+
+# Tool inputs the fake agent "decides" to run, in order, before answering
+DEFAULT_SCRIPT = [
+    "query('Sex == \"female\"')['Survived'].mean()",
+    "groupby('Pclass')['Fare'].mean()",
+]
+
+class FakeReActLLM(LLM):
+    """
+    Deterministic local stand-in for the OpenAI LLM.
+
+    Each call sleeps for `latency` seconds and then replies in the ReAct
+    format expected by ZERO_SHOT_REACT_DESCRIPTION: one Action per entry of
+    `script` (chosen by how many observations the prompt already contains),
+    followed by a Final Answer. Plan-mode prompts get a JSON plan running the
+    first script entry, and phrasing prompts get the final answer.
+    No network access is needed.
+    """
+
+    latency: float = 0.05
+    script: List[str] = DEFAULT_SCRIPT
+    tool_name: str = "PassengerQuery"
+    final_answer: str = "This is a scripted benchmark answer."
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-react"
+
+    def _reply(self, prompt):
+        self.calls += 1
+        if prompt.rstrip().endswith(PLAN_MARKER):
+            return json.dumps({
+                "expression": self.script[0],
+                "visualization_type": None,
+                "answer": f"The result is {RESULT_PLACEHOLDER}.",
+            })
+        if prompt.rstrip().endswith(ANSWER_MARKER):
+            return self.final_answer
+        # The format instructions mention "Observation:" once; each tool call adds one more
+        step = max(prompt.count("Observation:") - 1, 0)
+        if step < len(self.script):
+            tool_input = self.script[step]
+            return f"I should query the dataset.\nAction: {self.tool_name}\nAction Input: {tool_input}"
+        return f"I now know the final answer.\nFinal Answer: {self.final_answer}"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        time.sleep(self.latency)
+        return self._reply(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        await asyncio.sleep(self.latency)
+        return self._reply(prompt)
@@ -0,0 +1,252 @@
+"""
+Benchmark suite for the Titanic chatbot.
+
+Runs entirely in-process with a deterministic fake LLM, so timings do not
+depend on the network or the OpenAI API. For each dataset size it measures:
+
+- latency percentiles and throughput of /query, /query-form and /dataset-info
+  under concurrency (through the ASGI app, no sockets involved)
+- mean LLM calls per /query answer in each agent mode (--agent-modes)
+- load_titanic_dataset (cold and cached), query_passengers,
+  _simple_query_processor and every plot_* function
+
+Results are written as JSON; pass --baseline to compare against an earlier run.
+
+Usage:
+    python -m benchmarks.run_benchmarks --sizes 891,100000,1000000 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import data_loader
+from app.utils import visualizations
+from app.utils.agent import TitanicAgent
+from app.utils.agent_pool import agent_pool
+from app.utils.answer_cache import answer_cache
+from app.utils.scheduler import query_scheduler
+from benchmarks.fake_llm import FakeReActLLM
+
+BASE_DATASET = data_loader.DATA_PATH
+
+# Questions the intent router answers without the LLM
+DETERMINISTIC_QUESTIONS = [
+    "What percentage of passengers were male on the Titanic?",
+    "What was the average ticket fare?",
+    "How many passengers embarked from each port?",
+    "What was the survival rate by passenger class?",
+]
+# Questions that go through the (fake) LLM agent
+LLM_QUESTIONS = [
+    "Who paid the most for a ticket?",
+    "Which cabin had the most passengers?",
+    "How many children under 10 were on board?",
+    "List the five oldest passengers",
+]
+TOOL_QUERIES = [
+    "shape",
+    "Survived.mean()",
+    "query('Sex == \"female\" and Pclass == 1')['Survived'].mean()",
+    "groupby(['Sex', 'Pclass'])['Survived'].mean()",
+    "sort_values('Fare', ascending=False).head(5)",
+    "Embarked.value_counts()",
+]
+PLOT_FUNCTIONS = [name for name in dir(visualizations) if name.startswith("plot_")]
+
+def summarize(samples):
+    """Latency statistics in milliseconds"""
+    ms = sorted(sample * 1000 for sample in samples)
+    return {
+        "n": len(ms),
+        "min_ms": ms[0],
+        "mean_ms": statistics.fmean(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": ms[-1],
+    }
+
+def time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def synthetic_dataset(size, directory):
+    """Write a CSV with `size` rows resampled from the real dataset"""
+    if size <= 0:
+        return BASE_DATASET
+    path = os.path.join(directory, f"titanic_{size}.csv")
+    if not os.path.exists(path):
+        base = pd.read_csv(BASE_DATASET)
+        if size == len(base):
+            return BASE_DATASET
+        df = base.sample(n=size, replace=True, random_state=42).reset_index(drop=True)
+        df['PassengerId'] = np.arange(1, size + 1)
+        df.to_csv(path, index=False)
+    return path
+
+def bench_functions(repeat):
+    results = {}
+    results["load_titanic_dataset_cold"] = time_calls(data_loader.reload_dataset, max(1, repeat // 5))
+    results["load_titanic_dataset_cached"] = time_calls(data_loader.load_titanic_dataset, repeat)
+
+    agent = TitanicAgent(llm=FakeReActLLM(latency=0))
+    for query in TOOL_QUERIES:
+        results[f"query_passengers[{query}]"] = time_calls(lambda: agent.query_passengers(query), repeat)
+    for question in DETERMINISTIC_QUESTIONS + LLM_QUESTIONS[:1]:
+        results[f"_simple_query_processor[{question}]"] = time_calls(
+            lambda: agent._simple_query_processor(question), repeat
+        )
+    for name in PLOT_FUNCTIONS:
+        results[name] = time_calls(getattr(visualizations, name), max(1, repeat // 5))
+    return results
+
+async def bench_endpoint(client, method, path, payloads, concurrency, total):
+    """Fire `total` requests with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, errors, llm_calls = [], 0, []
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            if method == "GET":
+                response = await client.get(path)
+            else:
+                response = await client.post(path, **payloads[i % len(payloads)])
+            samples.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+            elif path.startswith("/query"):
+                llm_calls.append(response.json().get("llm_calls", 0))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    results = {**summarize(samples), "errors": errors, "throughput_rps": total / elapsed}
+    if llm_calls:
+        results["mean_llm_calls"] = statistics.fmean(llm_calls)
+    return results
+
+async def bench_api(concurrency, total, llm_latency, agent_modes=("react",)):
+    from app.api import app
+
+    # Measure latency, not admission control: only the global LLM slot limit
+    # applies, and no query is shed to the keyword fallback
+    query_scheduler.per_key_concurrency = None
+    query_scheduler.rate_per_minute = None
+    query_scheduler.default_deadline = None
+    query_scheduler.max_queue = max(query_scheduler.max_queue, total)
+
+    # Every pooled agent talks to the fake LLM instead of OpenAI
+    agent_pool.clear()
+    agent_pool.agent_factory = lambda **kwargs: TitanicAgent(llm=FakeReActLLM(latency=llm_latency), mode=agent_modes[0])
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        results["/dataset-info"] = await bench_endpoint(client, "GET", "/dataset-info", None, concurrency, total)
+        for label, questions in (("deterministic", DETERMINISTIC_QUESTIONS), ("llm", LLM_QUESTIONS)):
+            # Distinct suffixes defeat the answer cache so every request does the work
+            queries = [f"{questions[i % len(questions)]} #{i}" for i in range(total)]
+            json_payloads = [{"json": {"query": query}} for query in queries]
+            form_payloads = [{"data": {"query": query}} for query in queries]
+            answer_cache.clear()
+            results[f"/query[{label}]"] = await bench_endpoint(client, "POST", "/query", json_payloads, concurrency, total)
+            answer_cache.clear()
+            results[f"/query-form[{label}]"] = await bench_endpoint(client, "POST", "/query-form", form_payloads, concurrency, total)
+        cached_payloads = [{"json": {"query": question}} for question in LLM_QUESTIONS]
+        # Answer every question once first, so that only cache hits are timed
+        for payload in cached_payloads:
+            await client.post("/query", **payload)
+        results["/query[cached]"] = await bench_endpoint(client, "POST", "/query", cached_payloads, concurrency, total)
+
+        # The same LLM questions in the other agent modes, to compare latency and LLM calls
+        for mode in agent_modes[1:]:
+            agent_pool.clear()
+            agent_pool.agent_factory = lambda **kwargs: TitanicAgent(llm=FakeReActLLM(latency=llm_latency), mode=mode)
+            queries = [f"{LLM_QUESTIONS[i % len(LLM_QUESTIONS)]} #{mode}{i}" for i in range(total)]
+            answer_cache.clear()
+            results[f"/query[llm, {mode}]"] = await bench_endpoint(
+                client, "POST", "/query", [{"json": {"query": query}} for query in queries], concurrency, total
+            )
+    return results
+
+def compare(current, baseline):
+    """Print p50 ratios (current / baseline) for benchmarks present in both runs"""
+    previous = {(run["size"], name): stats for run in baseline["runs"] for name, stats in run["benchmarks"].items()}
+    print(f"{'size':>10}  {'benchmark':60}  {'p50 ratio':>9}")
+    for run in current["runs"]:
+        for name, stats in run["benchmarks"].items():
+            before = previous.get((run["size"], name))
+            if before and before["p50_ms"] > 0:
+                ratio = stats["p50_ms"] / before["p50_ms"]
+                flag = "  REGRESSION" if ratio > 1.2 else ""
+                print(f"{run['size']:>10}  {name[:60]:60}  {ratio:9.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="891,100000,1000000", help="comma-separated dataset row counts")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions per function benchmark")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent API requests")
+    parser.add_argument("--requests", type=int, default=200, help="API requests per endpoint")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM seconds per call")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--agent-modes", default="react,plan", help="comma-separated agent modes; the first is used for every API benchmark")
+    parser.add_argument("--skip-api", action="store_true", help="only run the function benchmarks")
+    args = parser.parse_args()
+
+    os.environ.setdefault("ANSWER_CACHE_WARMUP", "")
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "runs": [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix="titanic-bench-") as directory:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            path = synthetic_dataset(size, directory)
+            data_loader.set_data_path(path)
+            print(f"Benchmarking {size} rows ({path})...", file=sys.stderr)
+            # The agent runs verbosely; keep its chain logs out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                benchmarks = bench_functions(args.repeat)
+                if not args.skip_api:
+                    benchmarks.update(asyncio.run(bench_api(
+                        args.concurrency, args.requests, args.llm_latency, tuple(args.agent_modes.split(","))
+                    )))
+            report["runs"].append({"size": size, "benchmarks": benchmarks})
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
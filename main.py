@@ -1,31 +1,143 @@
 import os
 import sys
 import subprocess
-import streamlit as st
-
-st.set_page_config(
-    page_title="Titanic Chatbot",
-    page_icon="🚢",
-    layout="wide"
-)
+import time
+import urllib.request
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+API_PORT = int(os.environ.get("API_PORT", "8000"))
+UI_PORT = int(os.environ.get("UI_PORT", "8501"))
+STARTUP_TIMEOUT = float(os.environ.get("STARTUP_TIMEOUT", "60"))
+# Consecutive failed health checks before a running server is restarted
+MAX_HEALTH_FAILURES = 3
+MAX_RESTART_DELAY = 30.0
+
+def api_command():
+    """uvicorn command line; API_WORKERS > 1 starts that many worker processes"""
+    command = [sys.executable, '-m', 'uvicorn', 'app.api:app', '--host', '0.0.0.0', '--port', str(API_PORT)]
+    workers = int(os.environ.get("API_WORKERS", "1"))
+    if workers > 1:
+        command += ['--workers', str(workers)]
+    return command
+
+def ui_command():
+    return [
+        sys.executable, '-m', 'streamlit', 'run', 'app/streamlit_app.py',
+        '--server.port', str(UI_PORT), '--server.headless', 'true',
+    ]
+
+def publish_shared_dataset():
+    """
+    With several workers, publish the dataset to shared memory once so that
+    the workers attach to it instead of each loading a private copy
+    """
+    if int(os.environ.get("API_WORKERS", "1")) <= 1:
+        return
+    os.environ.setdefault("DATASET_SHARED_MEMORY", "1")
+    if os.environ["DATASET_SHARED_MEMORY"] == "1":
+        subprocess.run([sys.executable, '-m', 'app.utils.shared_dataset'], check=True)
+
+def is_healthy(url, timeout=1.0):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+class Service:
+    """A server process kept alive by the supervisor"""
+
+    def __init__(self, name, command, health_url):
+        self.name = name
+        self.command = command
+        self.health_url = health_url
+        self.process = None
+        self.started_at = None
+        self.ready = False
+        self.restarts = 0
+        self.failures = 0
+        self.restart_delay = 1.0
+        self.next_start = 0.0
+
+    def start(self):
+        self.process = subprocess.Popen(self.command)
+        self.started_at = time.perf_counter()
+        self.ready = False
+        self.failures = 0
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def check(self, now):
+        """Start, health-check or restart the service; called once per supervisor tick"""
+        if self.process is None:
+            if now >= self.next_start:
+                self.start()
+            return
+
+        if self.process.poll() is not None:
+            print(f"{self.name} exited with code {self.process.returncode}, restarting in {self.restart_delay:.0f}s")
+            self._schedule_restart(now)
+            return
+
+        if is_healthy(self.health_url):
+            if not self.ready:
+                self.ready = True
+                print(f"{self.name} ready in {time.perf_counter() - self.started_at:.2f}s ({self.health_url})")
+            self.failures = 0
+            self.restart_delay = 1.0
+        elif self.ready:
+            self.failures += 1
+            if self.failures >= MAX_HEALTH_FAILURES:
+                print(f"{self.name} failed {self.failures} health checks, restarting")
+                self.stop()
+                self._schedule_restart(now)
+        elif time.perf_counter() - self.started_at > STARTUP_TIMEOUT:
+            print(f"{self.name} not ready after {STARTUP_TIMEOUT:.0f}s, restarting")
+            self.stop()
+            self._schedule_restart(now)
+
+    def _schedule_restart(self, now):
+        # Back off exponentially so a crash loop doesn't spin
+        self.process = None
+        self.restarts += 1
+        self.next_start = now + self.restart_delay
+        self.restart_delay = min(self.restart_delay * 2, MAX_RESTART_DELAY)
+
+def supervise(services):
+    """Run the services until interrupted, reporting when all of them are ready"""
+    launched = time.perf_counter()
+    all_ready = False
+    try:
+        while True:
+            now = time.monotonic()
+            for service in services:
+                service.check(now)
+            if not all_ready and all(service.ready for service in services):
+                all_ready = True
+                print(f"All servers ready in {time.perf_counter() - launched:.2f}s")
+            time.sleep(0.1 if not all_ready else 1.0)
+    except KeyboardInterrupt:
+        print("Stopping servers...")
+    finally:
+        for service in services:
+            service.stop()
+
 def start_servers():
-    """Start both servers in separate terminals"""
-    print("Starting servers in separate terminals...")
+    """Start the API and the Streamlit UI and keep them running"""
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    
-    # For Windows
-    if os.name == 'nt':
-        subprocess.Popen(['start', 'cmd', '/k', 'python', '-m', 'uvicorn', 'app.api:app', '--host', '0.0.0.0', '--port', '8000'], shell=True)
-        subprocess.Popen(['start', 'cmd', '/k', 'streamlit', 'run', 'app/streamlit_app.py'], shell=True)
-    
-    # For Unix/Linux/MacOS
-    else:
-        subprocess.Popen(['python', '-m', 'uvicorn', 'app.api:app', '--host', '0.0.0.0', '--port', '8000'])
-        subprocess.Popen(['streamlit', 'run', 'app/streamlit_app.py'])
+    publish_shared_dataset()
+    supervise([
+        Service("API", api_command(), f"http://127.0.0.1:{API_PORT}/health"),
+        Service("UI", ui_command(), f"http://127.0.0.1:{UI_PORT}/_stcore/health"),
+    ])
 
 if __name__ == "__main__":
     # Check for OpenAI API key
@@ -33,5 +145,5 @@ if __name__ == "__main__":
         print("Warning: OPENAI_API_KEY environment variable not set.")
         print("You can still run the app, but you'll need to input an API key in the Streamlit interface.")
         print("Alternatively, set it using: set OPENAI_API_KEY=your_api_key_here")
-    
+
     start_servers()
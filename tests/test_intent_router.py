@@ -0,0 +1,49 @@
+import pytest
+
+from app.utils.agent import TitanicAgent
+from app.utils.intent_router import intent_router
+
+# Questions the precomputed averages and counts don't answer
+NOT_DETERMINISTIC = [
+    "What was the maximum fare?",
+    "What was the cheapest fare?",
+    "What was the total fare paid?",
+    "highest ticket price",
+    "max fare",
+    "What's the standard deviation of passenger ages?",
+    "What was the minimum age?",
+    "What was the median age?",
+    "How many passengers embarked at Cherbourg?",
+    "How much did passengers pay?",
+    "What was the average fare of first class passengers?",
+    "What percentage of women survived?",
+]
+
+DETERMINISTIC = [
+    ("What was the average age?", "age_distribution"),
+    ("Show me a histogram of passenger ages", "age_distribution"),
+    ("What was the average ticket fare?", "average_fare"),
+    ("What was the mean fare?", "average_fare"),
+    ("How many passengers embarked from each port?", "embarkation"),
+    ("What percentage of passengers were male on the Titanic?", "gender_distribution"),
+    ("What was the survival rate by passenger class?", "survival_by_class"),
+    ("Did women have a higher survival rate than men?", "survival_by_gender"),
+    ("How many passengers survived?", "survival_overall"),
+]
+
+@pytest.mark.parametrize("query", NOT_DETERMINISTIC)
+def test_other_aggregates_and_filters_are_not_routed(query):
+    decision = intent_router.route(query)
+    assert not decision.deterministic
+    assert not decision.covered
+
+@pytest.mark.parametrize("query,intent", DETERMINISTIC)
+def test_answerable_questions_are_routed(query, intent):
+    decision = intent_router.route(query)
+    assert decision.deterministic
+    assert decision.intent == intent
+
+@pytest.mark.parametrize("query", NOT_DETERMINISTIC)
+def test_keyword_fallback_declines_unanswerable_questions(query):
+    agent = TitanicAgent(api_key=None)
+    assert not agent._simple_query_processor(query)["success"]